@@ -1,35 +1,55 @@
 import os # Moved to top
 os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'
 from fastapi import FastAPI, File, UploadFile
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 
-from services.ocr_module import extract_text
-from services.preprocess import preprocess_image, light_preprocess_image
-from services.llm_module import translate_context, summarize_context
-
-import tempfile
-import io
+import asyncio
+from contextlib import asynccontextmanager
+from typing import List, Optional
 from fastapi import Body, HTTPException
-from fastapi.responses import HTMLResponse
-
-from services.speech_to_text import transcribe_audio, embed_transcription
-from services.llm_module import summarize_context, translate_context
-from langchain.embeddings import OllamaEmbeddings
-from langchain.vectorstores import FAISS
-from pypdf import PdfReader 
-from langchain.llms import Ollama
-
-# Define the path to the FAISS index (relative to this api.py file)
-FAISS_INDEX_PATH = "services/faiss_index"
 
-
-# Initialize Ollama components, passing the base_url
-OLLAMA_SERVICE_URL = os.getenv("LLM_API_URL", "http://localhost:11434")
-embeddings = OllamaEmbeddings(model="nomic-embed-text", base_url=OLLAMA_SERVICE_URL)
-llm = Ollama(model="gemma3:4b", base_url=OLLAMA_SERVICE_URL)
-
-app = FastAPI()
+from services.embeddings import get_embedding_client
+from services.preprocess import PROFILES
+from services.vector_store import FAISS_INDEX_PATH, RETRIEVAL_MODES, init_vector_store, normalize_collection
+from services.jobs import init_job_manager
+from services.response_cache import ResponseCache
+from services.reranker import RERANK_CANDIDATES, Reranker
+from services.context_builder import build_context
+from services.llm_module import get_llm_cache_stats
+from services.ollama_client import get_ollama_client
+from services.ingest import IngestError, ingest_image, ingest_image_batch, capture_image, ingest_pdf, ingest_audio
+
+# Initialize Ollama components
+embeddings = get_embedding_client()
+llm = get_ollama_client()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled async LLM client on this loop; the model is loaded and kept loaded
+    await llm.start()
+    preload = asyncio.create_task(llm.preload())
+    # The FAISS index lives in memory for the lifetime of the app
+    app.state.vector_store = init_vector_store(embeddings, FAISS_INDEX_PATH)
+    # Uploads are processed off the event loop by the ingestion job manager
+    app.state.jobs = init_job_manager()
+    app.state.response_cache = ResponseCache()
+    app.state.reranker = Reranker()
+    await run_in_threadpool(app.state.reranker.load)
+    await run_in_threadpool(app.state.jobs.warm_up)
+    await preload
+    yield
+    # Waiting for jobs must not block this loop: their LLM calls are served on it
+    await run_in_threadpool(app.state.jobs.shutdown)
+    # Flush any unsaved index changes on shutdown
+    app.state.vector_store.close()
+    embeddings.close()
+    await llm.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -37,245 +57,203 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-@app.post("/post-image", status_code=200)
-async def post_file_ocr(file: UploadFile = File(...)):
-    # Get valid file extension
-    suffix = os.path.splitext(file.filename)[-1].lower()
-    if suffix not in ['.jpg', '.jpeg', '.png']:
-        suffix = '.jpg'
-    
-    # Create temp file with valid extension
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temporary_image:
-        content = await file.read()
-        temporary_image.write(content)
-        temp_path = temporary_image.name
-    # Preprocessing
-    try:
-        preprocessed_file = light_preprocess_image(temp_path)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Preprocessing failed: {str(e)}")
-    
-    # OCR processing
+
+async def run_ingest_job(kind: str, file: UploadFile, pipeline, background: bool, *extra):
+    """Enqueue an ingestion pipeline; wait for it unless the client asked for a background job."""
     try:
-        extracted_text = extract_text(preprocessed_file)
-        if not extracted_text.strip():
-            print("OCR resulted in empty text. Skipping embedding.")
-        else:
-            print(f"OCR successful. Length: {len(extracted_text)}. Embedding extracted text...")
-            embed_transcription(extracted_text)
-            print(f"Embedding of extracted image/PDF text successful. FAISS index updated/created at {FAISS_INDEX_PATH}")
+        content = await file.read()
+    finally:
+        await file.close()
+    return await wait_for_job(kind, file.filename, background, pipeline, content, file.filename, *extra)
 
-    except Exception as e:
-        print(f"Error during OCR or Embedding for image/PDF: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"OCR or Embedding failed: {str(e)}")
-    
-    snippet_max_length = 250
-    if not extracted_text or not extracted_text.strip():
-        text_snippet = "No text extracted from document."
-    else:
-        text_snippet = extracted_text[:snippet_max_length] + "..." if len(extracted_text) > snippet_max_length else extracted_text
 
-    return JSONResponse(
-        status_code=200,
-        content={
-            "message": "Uploaded file processed successfully and content embedded.",
-            "image_path": preprocessed_file, 
-            "text_snippet": text_snippet
-        }
-    )
-    
+def check_profile(profile: Optional[str]):
+    if profile is not None and profile not in PROFILES:
+        raise HTTPException(status_code=400, detail=f"Unknown preprocessing profile '{profile}'. Use one of: {', '.join(PROFILES)}.")
 
-@app.post("/post-capture-image", status_code=200)
-async def post_capture_image(file: UploadFile = File(...)):
-    # Get valid file extension
-    suffix = os.path.splitext(file.filename)[-1].lower()
-    if suffix not in ['.jpg', '.jpeg', '.png']:
-        suffix = '.jpg'
-    
-    # Create temp file with valid extension
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temporary_image:
-        content = await file.read()
-        temporary_image.write(content)
-        temp_path = temporary_image.name
 
-    # Preprocessing
+def check_collection(collection: Optional[str]) -> str:
     try:
-        preprocessed_file = light_preprocess_image(temp_path)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Preprocessing failed: {str(e)}")
-    
-    # OCR processing
-    try:
-        extracted_text = extract_text(preprocessed_file)
-        if not extracted_text.strip():
-            print("OCR resulted in empty text. Skipping embedding.")
-        else:
-            print(f"OCR successful. Length: {len(extracted_text)}. Embedding extracted text...")
+        return normalize_collection(collection)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    except Exception as e:
-        # This will catch errors from extract_text or embed_transcription
-        print(f"Error during OCR or Embedding for image/PDF: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"OCR or Embedding failed: {str(e)}")
-    
-    # Translate the extracted text
-    translated_text = translate_context(extracted_text)
-    print(f"Translation attempted. Original length: {len(extracted_text)}, Translated length: {len(translated_text)}")
-    print(f"Translated text: {translated_text}") 
-    
-    # Generate text snippet
-    snippet_max_length = 250
-    if not translated_text.strip() or translated_text == "No text detected in image.": # Check if translate_text modified the "empty" message
-        text_snippet = "No text detected or translated from image."
-    else:
-        text_snippet = translated_text[:snippet_max_length] + "..." if len(translated_text) > snippet_max_length else translated_text
 
-    return JSONResponse(
-        status_code=200,
-        content={
-            "message": "Captured image processed and translated successfully.",
-            "image_path": preprocessed_file,
-            "translated_text": translated_text,
-            "text_snippet": text_snippet
-        }
-    )
-    
-@app.post("/post-pdf-direct", status_code=200)
-async def post_pdf_direct(file: UploadFile = File(...)):
-    try:
-        pdf_content_bytes = await file.read()
-        pdf_file = io.BytesIO(pdf_content_bytes)
-        
-        reader = PdfReader(pdf_file)
-        num_pages = len(reader.pages)
-        full_extracted_text = ""
-        for page_num in range(num_pages):
-            page = reader.pages[page_num]
-            full_extracted_text += page.extract_text() or ""
-
-        if not full_extracted_text.strip():
-            return JSONResponse(
-                status_code=400, 
-                content={"message": "No text could be extracted from the PDF."}
-            )
-
-        # Embed the full extracted text
-        print(f"PDF text extraction successful. Length: {len(full_extracted_text)}. Embedding extracted text...")
-        embed_transcription(full_extracted_text) 
-        print("Embedding of extracted PDF text successful.")
-
-        # Generate snippet
-        snippet_max_length = 250
-        text_snippet = full_extracted_text[:snippet_max_length]
-        if len(full_extracted_text) > snippet_max_length:
-            text_snippet += "..."
-        
+async def wait_for_job(kind: str, filename: str, background: bool, pipeline, *args):
+    job_id, future = app.state.jobs.submit(kind, filename, pipeline, *args)
+    if background:
         return JSONResponse(
-            status_code=200,
-            content={
-                "message": "PDF processed successfully, text extracted and embedded.",
-                "text_snippet": text_snippet,
-                "page_count": num_pages
-            }
+            status_code=202,
+            content={"job_id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}"}
         )
+
+    # Await the worker without blocking the event loop
+    try:
+        result = await asyncio.wrap_future(future)
+    except IngestError as e:
+        if e.status_code < 500:
+            return JSONResponse(status_code=e.status_code, content={"message": e.detail})
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     except Exception as e:
-        print(f"Error processing PDF directly: {str(e)}") 
+        print(f"Error in {kind} job {job_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to process {kind}: {str(e)}")
+    return JSONResponse(status_code=200, content=result)
 
-        raise HTTPException(status_code=500, detail=f"Failed to process PDF: {str(e)}")
-    finally:
-        await file.close()
 
+@app.post("/post-image", status_code=200)
+async def post_file_ocr(file: UploadFile = File(...), background: bool = False, profile: Optional[str] = None,
+                        collection: Optional[str] = None):
+    check_profile(profile)
+    collection = check_collection(collection)
+    return await run_ingest_job("image", file, ingest_image, background, profile, collection)
+
+
+# Endpoint to OCR many images in one request with a single index update
+@app.post("/post-images", status_code=200)
+async def post_images_ocr(files: List[UploadFile] = File(...), background: bool = False, profile: Optional[str] = None,
+                          collection: Optional[str] = None):
+    check_profile(profile)
+    collection = check_collection(collection)
+    uploads = []
+    for file in files:
+        try:
+            uploads.append((file.filename, await file.read()))
+        finally:
+            await file.close()
+    return await wait_for_job("image-batch", f"{len(uploads)} images", background, ingest_image_batch, uploads, profile, collection)
 
-# Endpoint to process audio: transcribe and embed
-@app.post("/post-audio", status_code=200)
-async def process_audio_endpoint(file: UploadFile = File(...)):
-    try:
-        suffix = os.path.splitext(file.filename)[-1].lower()
-        if not suffix: 
-            suffix = '.mp3'
 
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temporary_audio_file:
-            content = await file.read()
-            temporary_audio_file.write(content)
-            temp_audio_path = temporary_audio_file.name
+@app.post("/post-capture-image", status_code=200)
+async def post_capture_image(file: UploadFile = File(...), background: bool = False, profile: Optional[str] = None):
+    check_profile(profile)
+    return await run_ingest_job("capture", file, capture_image, background, profile)
 
-        print(f"Temporary audio file saved at: {temp_audio_path}")
 
-        # 1. Transcribe audio
-        transcript = transcribe_audio(temp_audio_path)
-        print(f"Transcription successful. Length: {len(transcript)}")
+@app.post("/post-pdf-direct", status_code=200)
+async def post_pdf_direct(file: UploadFile = File(...), background: bool = False, collection: Optional[str] = None):
+    collection = check_collection(collection)
+    return await run_ingest_job("pdf", file, ingest_pdf, background, collection)
 
-        # 2. Summarize transcription
-        summary = summarize_context(transcript)
-        print(f"Summarization of transcript successful.")
 
+# Endpoint to process audio: transcribe and summarize
+@app.post("/post-audio", status_code=200)
+async def process_audio_endpoint(file: UploadFile = File(...), background: bool = False,
+                                 collection: Optional[str] = None):
+    collection = check_collection(collection)
+    return await run_ingest_job("audio", file, ingest_audio, background, collection)
+
+
+# Endpoint to poll an ingestion job started with ?background=true
+@app.get("/jobs/{job_id}", status_code=200)
+async def job_status_endpoint(job_id: str):
+    job = app.state.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return JSONResponse(status_code=200, content=job)
+
+# Endpoints listing what has been ingested, for choosing a chat scope
+@app.get("/collections", status_code=200)
+async def collections_endpoint():
+    collections = await run_in_threadpool(app.state.vector_store.collections)
+    return JSONResponse(status_code=200, content={"collections": collections})
+
+
+@app.get("/collections/{collection}/documents", status_code=200)
+async def collection_documents_endpoint(collection: str):
+    documents = await run_in_threadpool(app.state.vector_store.list_documents, check_collection(collection))
+    return JSONResponse(status_code=200, content={"documents": documents})
+
+# Chunks retrieved per chat query; build_context then packs them into the token budget
+CHAT_TOP_K = int(os.getenv("CHAT_TOP_K", "5"))
+NO_CONTEXT_ANSWER = "No relevant information found in the audio context to answer your query."
+
+
+async def prepare_chat(payload: dict):
+    """Retrieve context for the query and check the response cache.
+
+    The payload may restrict retrieval with "collection" and/or "document_ids"
+    (the document_id values returned by the upload endpoints), and pick the
+    retrieval "mode": hybrid, vector or lexical.
+
+    Returns a JSONResponse to send as-is, or a dict with the query, its vector, the
+    retrieved chunk ids, the prompt (None when nothing was retrieved) and any cached answer.
+    """
+    query = payload.get("query")
+    if not query:
+        raise HTTPException(status_code=400, detail="Query cannot be empty.")
+    collection = check_collection(payload["collection"]) if payload.get("collection") is not None else None
+    document_ids = payload.get("document_ids")
+    if document_ids is not None and (not isinstance(document_ids, list)
+                                     or not all(isinstance(i, str) for i in document_ids)):
+        raise HTTPException(status_code=400, detail="document_ids must be a list of document id strings.")
+    mode = payload.get("mode")
+    if mode is not None and mode not in RETRIEVAL_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown retrieval mode '{mode}'. Use one of: {', '.join(RETRIEVAL_MODES)}.")
+
+    vector_store = app.state.vector_store
+    if await run_in_threadpool(vector_store.is_empty):
         return JSONResponse(
-            status_code=200,
-            content={
-                "message": "Audio processed and summarized successfully.", 
-                "summary": summary
-            }
+            status_code=404,
+            content={"message": "FAISS index not found. Please upload and process the content first."}
         )
-    except Exception as e:
-        print(f"Error in /post-audio: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error processing audio: {str(e)}")
-    finally:
-        # Clean up the temporary audio file
-        if 'temp_audio_path' in locals() and os.path.exists(temp_audio_path):
-            os.remove(temp_audio_path)
-            print(f"Temporary audio file {temp_audio_path} deleted.")
+
+    # Perform similarity search
+    query_vector = await run_in_threadpool(embeddings.embed_query, query)
+    reranker = app.state.reranker
+    docs = await run_in_threadpool(vector_store.search, query, query_vector,
+                                   max(RERANK_CANDIDATES, CHAT_TOP_K) if reranker.enabled else CHAT_TOP_K,
+                                   collection, document_ids, mode)
+    print(f"Similarity search found {len(docs)} documents.")
+    if reranker.enabled:
+        # Over-fetched candidates are narrowed to the best CHAT_TOP_K within the rerank time budget
+        docs = await run_in_threadpool(reranker.rerank, query, docs, CHAT_TOP_K)
+
+    chat = {"query": query, "query_vector": query_vector, "chunk_ids": [doc.id for doc in docs],
+            "prompt": None, "cached_answer": None}
+    if not docs:
+        return chat
+
+    # Same question over the same retrieved context: reuse the earlier answer
+    chat["cached_answer"] = app.state.response_cache.get(query, chat["chunk_ids"], query_vector)
+    if chat["cached_answer"] is not None:
+        print("Chat response cache hit.")
+        return chat
+
+    # Construct context for the LLM: overlaps removed, adjacent chunks merged, packed to the token budget
+    context, context_tokens = build_context(docs)
+    print(f"Packed {len(docs)} chunks into {context_tokens} context tokens.")
+
+    # Construct prompt for LLM
+    chat["prompt"] = f"You are an assistant for question-answering tasks. Use the following pieces of retrieved context \n\n---\n{context}\n to answer the question. If you don't know the answer, say that you don't know. DON'T MAKE UP ANYTHING. Answer the question informatively, but based on the above context---\n\nUser Query: {query}\n\n"
+    return chat
+
+
+def cache_answer(chat: dict, answer: str):
+    app.state.response_cache.put(chat["query"], chat["chunk_ids"], chat["query_vector"], answer)
+
 
 # Endpoint for chat using the FAISS index
 @app.post("/chat", status_code=200)
 async def chat_endpoint(payload: dict = Body(...)):
     try:
-        query = payload.get("query")
-        if not query:
-            raise HTTPException(status_code=400, detail="Query cannot be empty.")
-
-        # Check if FAISS index exists
-        if not os.path.exists(FAISS_INDEX_PATH) or not os.path.isdir(FAISS_INDEX_PATH):
+        chat = await prepare_chat(payload)
+        if isinstance(chat, JSONResponse):
+            return chat
+        if chat["cached_answer"] is not None:
             return JSONResponse(
-                status_code=404,
-                content={"message": "FAISS index not found. Please upload and process the content first."}
-            )
-
-        # Load the FAISS index
-        try:
-            vector_store = FAISS.load_local(
-                FAISS_INDEX_PATH,
-                embeddings,
-                allow_dangerous_deserialization=True
+                status_code=200,
+                content={"answer": chat["cached_answer"], "cached": True}
             )
-            print(f"FAISS index loaded successfully from {FAISS_INDEX_PATH}")
-        except Exception as e:
-            print(f"Error loading FAISS index: {str(e)}")
-            if "No such file or directory" in str(e) and "index.faiss" in str(e):
-                 error_detail = "FAISS index files (e.g., index.faiss, index.pkl) not found. Ensure uploaded file was processed."
-            else:
-                error_detail = f"Could not load FAISS index: {str(e)}"
-            raise HTTPException(status_code=500, detail=error_detail)
-
-
-        # Perform similarity search
-        docs = vector_store.similarity_search(query, k=3) # Retrieve top 3 relevant chunks
-        print(f"Similarity search found {len(docs)} documents.")
-
-        if not docs:
+        if chat["prompt"] is None:
             return JSONResponse(
                 status_code=200, # Or 404 if preferred when no context found
-                content={"answer": "No relevant information found in the audio context to answer your query."}
+                content={"answer": NO_CONTEXT_ANSWER}
             )
 
-        # Construct context for the LLM
-        context = "\n".join([doc.page_content for doc in docs])
-
-        # Construct prompt for LLM
-        prompt_template = f"You are an assistant for question-answering tasks. Use the following pieces of retrieved context \n\n---\n{context}\n to answer the question. If you don't know the answer, say that you don't know. DON'T MAKE UP ANYTHING. Answer the question informatively, but based on the above context---\n\nUser Query: {query}\n\n"
-
-
         # Invoke the LLM
-        response = llm.invoke(prompt_template)
+        response = await llm.generate(chat["prompt"])
         print(f"LLM response received: {response}")
+        cache_answer(chat, response)
 
         return JSONResponse(
             status_code=200,
@@ -286,3 +264,62 @@ async def chat_endpoint(payload: dict = Body(...)):
     except Exception as e:
         print(f"Error in /chat: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error during chat: {str(e)}")
+
+
+# Endpoint for chat that streams the answer as chunked text while Ollama generates it
+@app.post("/chat/stream", status_code=200)
+async def chat_stream_endpoint(payload: dict = Body(...)):
+    try:
+        chat = await prepare_chat(payload)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        print(f"Error in /chat/stream: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error during chat: {str(e)}")
+    if isinstance(chat, JSONResponse):
+        return chat
+
+    async def generate():
+        if chat["cached_answer"] is not None:
+            yield chat["cached_answer"]
+            return
+        if chat["prompt"] is None:
+            yield NO_CONTEXT_ANSWER
+            return
+        tokens = []
+        try:
+            # Tokens are relayed from Ollama on the event loop as they arrive
+            async for token in llm.stream(chat["prompt"]):
+                tokens.append(token)
+                yield token
+        except Exception as e:
+            # Headers are already sent, so report the failure in-band
+            print(f"Error while streaming /chat/stream: {str(e)}")
+            yield f"\n\n[Error during chat: {str(e)}]"
+            return
+        cache_answer(chat, "".join(tokens))
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/plain; charset=utf-8",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# Endpoint exposing model load and inference timings
+@app.get("/metrics", status_code=200)
+async def metrics_endpoint():
+    return JSONResponse(
+        status_code=200,
+        content={
+            "ocr": app.state.jobs.ocr_stats(),
+            "ingest": app.state.jobs.stats(),
+            "embedding_cache": embeddings.cache_stats(),
+            "document_dedup": app.state.vector_store.document_stats(),
+            "chat_cache": app.state.response_cache.stats(),
+            "vector_index": app.state.vector_store.index_stats(),
+            "reranker": app.state.reranker.stats(),
+            "lexical_index": app.state.vector_store.lexical_stats(),
+            "llm_cache": get_llm_cache_stats()
+        }
+    )
@@ -0,0 +1,90 @@
+# Recall-vs-latency report for the vector index types on the stored corpus.
+#
+# Usage (from backend/):
+#   python benchmarks/index_benchmark.py [services/faiss_index] [--dim 768] [--queries 200] [--k 10]
+#                                        [--limit 1000000] [--types flat,hnsw,ivf_flat,ivf_pq]
+#
+# Reads vectors.f32 from the index directory, holds out --queries of them as queries,
+# builds each index type over the rest and compares its top-k against exact search.
+# HNSW is swept over efSearch and IVF over nprobe, since those trade recall for latency.
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss
+import numpy as np
+
+from services.ann_index import INDEX_TYPES, RawVectorFile, build_index
+from services.vector_store import FAISS_INDEX_PATH, VECTORS_FILE
+
+EF_SEARCH = (16, 32, 64, 128, 256)
+NPROBE = (1, 4, 16, 64, 256)
+
+
+def load_vectors(index_dir: str, dimension: int, limit: int):
+    raw = RawVectorFile(os.path.join(index_dir, VECTORS_FILE))
+    if os.path.getsize(raw.path) % (4 * dimension):
+        sys.exit(f"{raw.path} is not a whole number of {dimension}-dimensional vectors; check --dim.")
+    return np.ascontiguousarray(raw.read(dimension, 0, limit or None))
+
+
+def settings_for(kind: str):
+    if kind == "hnsw":
+        return [(f"efSearch={ef}", faiss.SearchParametersHNSW(efSearch=ef)) for ef in EF_SEARCH]
+    if kind in ("ivf_flat", "ivf_pq"):
+        return [(f"nprobe={n}", faiss.SearchParametersIVF(nprobe=n)) for n in NPROBE]
+    return [("exact", None)]
+
+
+def measure(index, queries, k: int, params, truth):
+    latencies = []
+    found = 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        _, ids = index.search(query[None, :], k, params=params) if params is not None else index.search(query[None, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found += len(set(ids[0].tolist()) & set(expected.tolist()))
+    return found / (len(queries) * k), statistics.median(latencies), sorted(latencies)[int(0.95 * (len(latencies) - 1))]
+
+
+def run(index_dir: str, dimension: int, query_count: int, k: int, limit: int, kinds):
+    vectors = load_vectors(index_dir, dimension, limit)
+    if len(vectors) <= query_count:
+        sys.exit(f"Only {len(vectors)} vectors stored; need more than --queries={query_count}.")
+    held_out = np.random.default_rng(0).choice(len(vectors), size=query_count, replace=False)
+    mask = np.ones(len(vectors), dtype=bool)
+    mask[held_out] = False
+    queries, base = vectors[held_out], np.ascontiguousarray(vectors[mask])
+
+    exact = build_index("flat", base)
+    _, truth = exact.search(queries, k)
+    print(f"{len(base)} vectors (d={dimension}), {query_count} held-out queries, recall@{k}\n")
+    print(f"{'index':<10} {'setting':<14} {'build s':>8} {'MB':>9} {'recall':>7} {'p50 ms':>8} {'p95 ms':>8}")
+    for kind in kinds:
+        start = time.perf_counter()
+        index = build_index(kind, base)
+        build_seconds = time.perf_counter() - start
+        size_mb = len(faiss.serialize_index(index)) / 2 ** 20
+        for label, params in settings_for(kind):
+            recall, p50, p95 = measure(index, queries, k, params, truth)
+            print(f"{kind:<10} {label:<14} {build_seconds:>8.1f} {size_mb:>9.1f} {recall:>7.3f} {p50:>8.2f} {p95:>8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report recall vs latency for each vector index type.")
+    parser.add_argument("index_dir", nargs="?", default=FAISS_INDEX_PATH)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--limit", type=int, default=0, help="Use only the first N stored vectors (0: all)")
+    parser.add_argument("--types", default=",".join(INDEX_TYPES))
+    args = parser.parse_args()
+    kinds = [kind.strip() for kind in args.types.split(",") if kind.strip()]
+    unknown = [kind for kind in kinds if kind not in INDEX_TYPES]
+    if unknown:
+        sys.exit(f"Unknown index types: {', '.join(unknown)}. Use: {', '.join(INDEX_TYPES)}.")
+    run(args.index_dir, args.dim, args.queries, args.k, args.limit, kinds)
@@ -0,0 +1,93 @@
+# Compare preprocessing profiles on a local image set.
+#
+# Usage (from backend/):
+#   python benchmarks/preprocess_benchmark.py path/to/images [--profiles fast,balanced,quality] [--repeat 3]
+#
+# For every image, an optional ground-truth transcription with the same name and a
+# .txt extension (receipt01.jpg -> receipt01.txt) enables the accuracy column, which is
+# 1 - character error rate of the OCR output against that text.
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+
+from services.ocr_module import extract_text, warm_up_ocr
+from services.preprocess import PROFILES, light_preprocess_image
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def char_accuracy(predicted: str, expected: str) -> float:
+    # Whitespace and line breaks differ between OCR output and hand transcriptions
+    predicted = "".join(predicted.split())
+    expected = "".join(expected.split())
+    if not expected:
+        return 1.0 if not predicted else 0.0
+    try:
+        from rapidfuzz.distance import Levenshtein
+        distance = Levenshtein.distance(predicted, expected)
+    except ImportError:
+        import difflib
+        matcher = difflib.SequenceMatcher(None, predicted, expected)
+        distance = max(len(predicted), len(expected)) - sum(block.size for block in matcher.get_matching_blocks())
+    return max(0.0, 1.0 - distance / len(expected))
+
+
+def load_images(image_dir: str):
+    images = []
+    for name in sorted(os.listdir(image_dir)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        image = cv2.imread(os.path.join(image_dir, name))
+        if image is None:
+            print(f"Skipping unreadable image {name}")
+            continue
+        truth_path = os.path.join(image_dir, os.path.splitext(name)[0] + ".txt")
+        truth = None
+        if os.path.exists(truth_path):
+            with open(truth_path, encoding="utf-8") as f:
+                truth = f.read()
+        images.append((name, image, truth))
+    return images
+
+
+def run(image_dir: str, profiles, repeat: int, lang: str):
+    images = load_images(image_dir)
+    if not images:
+        sys.exit(f"No images found in {image_dir}")
+    # Keep engine load time out of the measurements
+    warm_up_ocr([lang])
+
+    print(f"{len(images)} images, {repeat} run(s) per profile\n")
+    print(f"{'profile':<10} {'preprocess ms':>14} {'ocr ms':>10} {'total ms':>10} {'accuracy':>9}")
+    for profile in profiles:
+        preprocess_ms, ocr_ms, accuracies = [], [], []
+        for name, image, truth in images:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                preprocessed = light_preprocess_image(image, profile)
+                middle = time.perf_counter()
+                text = extract_text(preprocessed, lang=lang)
+                end = time.perf_counter()
+                preprocess_ms.append((middle - start) * 1000)
+                ocr_ms.append((end - middle) * 1000)
+            if truth is not None:
+                accuracies.append(char_accuracy(text, truth))
+        accuracy = f"{statistics.mean(accuracies):.3f}" if accuracies else "n/a"
+        print(f"{profile:<10} {statistics.median(preprocess_ms):>14.1f} {statistics.median(ocr_ms):>10.1f} "
+              f"{statistics.median(preprocess_ms) + statistics.median(ocr_ms):>10.1f} {accuracy:>9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark OCR preprocessing profiles.")
+    parser.add_argument("image_dir")
+    parser.add_argument("--profiles", default=",".join(PROFILES))
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--lang", default="ch")
+    args = parser.parse_args()
+    run(args.image_dir, [p.strip() for p in args.profiles.split(",") if p.strip()], max(1, args.repeat), args.lang)
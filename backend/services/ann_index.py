@@ -0,0 +1,130 @@
+# === ann_index ===
+import faiss
+import math
+import numpy as np
+import os
+
+# Index used once the corpus reaches VECTOR_INDEX_MIGRATE_AT vectors: flat, hnsw, ivf_flat or ivf_pq
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "flat")
+# Below this many vectors exact flat search is fast enough and nothing needs training
+VECTOR_INDEX_MIGRATE_AT = int(os.getenv("VECTOR_INDEX_MIGRATE_AT", "50000"))
+# HNSW graph degree and search breadth
+VECTOR_HNSW_M = int(os.getenv("VECTOR_HNSW_M", "32"))
+VECTOR_HNSW_EF_SEARCH = int(os.getenv("VECTOR_HNSW_EF_SEARCH", "64"))
+# IVF cells (0 picks about 4 * sqrt(vectors)) and cells probed per query
+VECTOR_IVF_NLIST = int(os.getenv("VECTOR_IVF_NLIST", "0"))
+VECTOR_IVF_NPROBE = int(os.getenv("VECTOR_IVF_NPROBE", "16"))
+# PQ sub-quantizers (0 picks the largest divisor of the dimension up to 64); 8 bits each
+VECTOR_PQ_M = int(os.getenv("VECTOR_PQ_M", "0"))
+# Filtered searches allowing at most this many vectors are scored exactly from vectors.f32
+# instead of through the approximate index, which finds few of a small subset
+VECTOR_EXACT_FILTER_MAX = int(os.getenv("VECTOR_EXACT_FILTER_MAX", "4096"))
+
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq")
+# Training vectors sampled per IVF cell
+_TRAIN_PER_LIST = 64
+_ADD_BATCH = 65536
+
+
+def index_kind(index) -> str:
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf_flat"
+    return "flat"
+
+
+def _nlist(count: int) -> int:
+    return VECTOR_IVF_NLIST or max(1, int(4 * math.sqrt(count)))
+
+
+def _pq_m(dimension: int) -> int:
+    if VECTOR_PQ_M:
+        return VECTOR_PQ_M
+    return max(m for m in range(1, min(64, dimension) + 1) if dimension % m == 0)
+
+
+def index_description(kind: str, dimension: int, count: int) -> str:
+    """faiss.index_factory string for `kind` sized for `count` vectors."""
+    if kind == "hnsw":
+        return f"HNSW{VECTOR_HNSW_M},Flat"
+    if kind == "ivf_flat":
+        return f"IVF{_nlist(count)},Flat"
+    if kind == "ivf_pq":
+        return f"IVF{_nlist(count)},PQ{_pq_m(dimension)}"
+    return "Flat"
+
+
+def build_index(kind: str, vectors, description: str = None):
+    """Train (if needed) and fill an index of `kind` from an (n, d) float32 array or memmap."""
+    count, dimension = vectors.shape
+    index = faiss.index_factory(dimension, description or index_description(kind, dimension, count), faiss.METRIC_L2)
+    if not index.is_trained:
+        # PQ codebooks need a few thousand points even when there are few IVF cells
+        train_count = min(count, max(_TRAIN_PER_LIST * faiss.extract_index_ivf(index).nlist, 10000))
+        sample = np.sort(np.random.default_rng(0).choice(count, size=train_count, replace=False))
+        index.train(np.ascontiguousarray(vectors[sample], dtype=np.float32))
+    for start in range(0, count, _ADD_BATCH):
+        index.add(np.ascontiguousarray(vectors[start:start + _ADD_BATCH], dtype=np.float32))
+    return index
+
+
+def search_parameters(index, selector=None, breadth: int = 1):
+    """Per-query parameters for `index`: its search breadth plus an optional ID selector.
+
+    `breadth` multiplies the configured efSearch / nprobe, up to what the index holds.
+    """
+    kind = index_kind(index)
+    if kind == "hnsw":
+        return faiss.SearchParametersHNSW(efSearch=min(VECTOR_HNSW_EF_SEARCH * breadth,
+                                                       max(VECTOR_HNSW_EF_SEARCH, index.ntotal)), sel=selector)
+    if kind in ("ivf_flat", "ivf_pq"):
+        return faiss.SearchParametersIVF(nprobe=min(VECTOR_IVF_NPROBE * breadth, faiss.extract_index_ivf(index).nlist),
+                                         sel=selector)
+    return faiss.SearchParameters(sel=selector) if selector is not None else None
+
+
+def max_breadth(index) -> int:
+    """Smallest `breadth` at which search_parameters already searches as widely as `index` allows."""
+    kind = index_kind(index)
+    if kind == "hnsw":
+        return max(1, math.ceil(index.ntotal / VECTOR_HNSW_EF_SEARCH))
+    if kind in ("ivf_flat", "ivf_pq"):
+        return max(1, math.ceil(faiss.extract_index_ivf(index).nlist / VECTOR_IVF_NPROBE))
+    return 1
+
+
+class RawVectorFile:
+    """Append-only float32 file holding every indexed vector in id order.
+
+    IVF-PQ cannot reproduce the vectors it was given, so this file is what any
+    index is rebuilt or retrained from.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def rows(self, dimension: int) -> int:
+        if not os.path.exists(self.path):
+            return 0
+        return os.path.getsize(self.path) // (4 * dimension)
+
+    def truncate(self, dimension: int, rows: int):
+        with open(self.path, "r+b") as f:
+            f.truncate(rows * 4 * dimension)
+
+    def append(self, vectors: np.ndarray):
+        with open(self.path, "ab") as f:
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+    def read(self, dimension: int, start: int = 0, stop: int = None):
+        """Rows [start, stop) as a read-only memmap (an empty array when there are none)."""
+        rows = self.rows(dimension)
+        stop = rows if stop is None else min(stop, rows)
+        if stop <= start:
+            return np.empty((0, dimension), dtype=np.float32)
+        return np.memmap(self.path, dtype=np.float32, mode="r", shape=(rows, dimension))[start:stop]
@@ -0,0 +1,146 @@
+# === chunk_store ===
+import json
+import sqlite3
+import threading
+import time
+
+DEFAULT_COLLECTION = "default"
+
+
+class ChunkStore:
+    """SQLite table of chunk texts and metadata keyed by FAISS vector id.
+
+    Only rows for the ids returned by a search are read, so startup and queries
+    never materialize the whole corpus in memory. The "document_id" and "collection"
+    metadata keys are mirrored into indexed columns for filtered retrieval.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                " id INTEGER PRIMARY KEY,"
+                " text TEXT NOT NULL,"
+                " metadata TEXT NOT NULL DEFAULT '{}',"
+                " document_id TEXT,"
+                " collection TEXT NOT NULL DEFAULT 'default')"
+            )
+            # One row per ingested upload, keyed by hash of the file bytes and its collection
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                " file_hash TEXT NOT NULL,"
+                " collection TEXT NOT NULL DEFAULT 'default',"
+                " filename TEXT,"
+                " chunk_count INTEGER NOT NULL,"
+                " info TEXT NOT NULL DEFAULT '{}',"
+                " created_at REAL NOT NULL,"
+                " PRIMARY KEY (file_hash, collection))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_collection ON chunks (collection)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_document ON chunks (document_id)")
+
+    def add(self, ids, texts, metadatas=None):
+        metadatas = metadatas or [{} for _ in texts]
+        rows = [
+            (int(i), text, json.dumps(metadata or {}), (metadata or {}).get("document_id"),
+             (metadata or {}).get("collection") or DEFAULT_COLLECTION)
+            for i, text, metadata in zip(ids, texts, metadatas)
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (id, text, metadata, document_id, collection) VALUES (?, ?, ?, ?, ?)",
+                rows)
+
+    def get(self, ids) -> dict:
+        """Return {id: (text, metadata)} for the ids that exist."""
+        ids = [int(i) for i in ids]
+        if not ids:
+            return {}
+        placeholders = ",".join("?" * len(ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, text, metadata FROM chunks WHERE id IN ({placeholders})", ids
+            ).fetchall()
+        return {row[0]: (row[1], json.loads(row[2])) for row in rows}
+
+    def ids_for(self, collection: str = None, document_ids=None):
+        """Vector ids of the chunks in `collection` and/or belonging to `document_ids`."""
+        clauses, params = [], []
+        if collection is not None:
+            clauses.append("collection = ?")
+            params.append(collection)
+        if document_ids is not None:
+            document_ids = list(document_ids)
+            clauses.append(f"document_id IN ({','.join('?' * len(document_ids))})")
+            params.extend(document_ids)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            return [row[0] for row in self._conn.execute(f"SELECT id FROM chunks{where}", params)]
+
+    def collections(self):
+        """[{name, documents, chunks}] for every collection that has chunks or documents."""
+        with self._lock:
+            chunks = dict(self._conn.execute("SELECT collection, COUNT(*) FROM chunks GROUP BY collection"))
+            documents = dict(self._conn.execute("SELECT collection, COUNT(*) FROM documents GROUP BY collection"))
+        return [{"name": name, "documents": documents.get(name, 0), "chunks": chunks.get(name, 0)}
+                for name in sorted(set(chunks) | set(documents))]
+
+    def list_documents(self, collection: str):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT file_hash, filename, chunk_count, info, created_at FROM documents"
+                " WHERE collection = ? ORDER BY created_at", (collection,)
+            ).fetchall()
+        return [{"document_id": row[0], "collection": collection, "filename": row[1], "chunk_count": row[2],
+                 "info": json.loads(row[3]), "created_at": row[4]} for row in rows]
+
+    def iter_texts(self, batch_size: int = 5000):
+        """Yield (id, text) for every chunk in id order, reading `batch_size` rows at a time."""
+        last_id = -1
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT id, text FROM chunks WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            yield from rows
+            last_id = rows[-1][0]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def delete_from(self, first_id: int) -> int:
+        """Drop chunks whose vectors never reached the index (id >= first_id)."""
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM chunks WHERE id >= ?", (int(first_id),)).rowcount
+
+    def get_document(self, file_hash: str, collection: str = DEFAULT_COLLECTION):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT filename, chunk_count, info, created_at FROM documents WHERE file_hash = ? AND collection = ?",
+                (file_hash, collection)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"file_hash": file_hash, "collection": collection, "filename": row[0], "chunk_count": row[1],
+                "info": json.loads(row[2]), "created_at": row[3]}
+
+    def add_document(self, file_hash: str, filename: str, chunk_count: int, info: dict = None,
+                     collection: str = DEFAULT_COLLECTION):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO documents (file_hash, collection, filename, chunk_count, info, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (file_hash, collection, filename, chunk_count, json.dumps(info or {}), time.time()),
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,44 @@
+# === chunking ===
+# Splitting of extracted text and timed transcript segments into index chunks.
+# Kept free of model imports so retrieval code can use the chunk settings cheaply.
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+import os
+
+# Split text into manageable chunks for embedding
+# Characters per index chunk, and characters shared by consecutive chunks
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1000"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))
+text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+
+def split_segments_into_chunks(segments, metadata=None):
+    """Group timed segments into index chunks of about the text splitter's size.
+
+    Every chunk gets a copy of `metadata` plus the "start" and "end" time of its
+    segments; consecutive chunks share their boundary segment(s) as overlap.
+    """
+    texts, metadatas = [], []
+    current = []
+    length = 0
+    for segment in segments:
+        if current and length + len(segment["text"]) > CHUNK_SIZE:
+            texts.append(" ".join(item["text"] for item in current))
+            metadatas.append(dict(metadata or {}, start=current[0]["start"], end=current[-1]["end"]))
+            # Carry trailing segments over as overlap, like the character splitter does
+            overlap = []
+            while current and sum(len(item["text"]) for item in overlap) + len(current[-1]["text"]) <= CHUNK_OVERLAP:
+                overlap.insert(0, current.pop())
+            current = overlap
+            length = sum(len(item["text"]) + 1 for item in current)
+        current.append(segment)
+        length += len(segment["text"]) + 1
+    if current:
+        texts.append(" ".join(item["text"] for item in current))
+        metadatas.append(dict(metadata or {}, start=current[0]["start"], end=current[-1]["end"]))
+    return texts, metadatas
+
+
+def split_into_chunks(text, metadata=None):
+    """Split text into index chunks; every chunk gets a copy of `metadata`."""
+    texts = text_splitter.split_text(text)
+    return texts, [dict(metadata or {}) for _ in texts]
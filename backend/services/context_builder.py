@@ -0,0 +1,135 @@
+# === context_builder ===
+from services.chunking import CHUNK_OVERLAP
+import math
+import os
+import re
+import threading
+
+# Tokens of retrieved context allowed in a chat prompt
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", "1024"))
+# Below this many tokens of remaining budget a chunk is dropped rather than truncated
+_MIN_PARTIAL_TOKENS = 48
+# Shortest shared text treated as chunk overlap rather than coincidence
+_MIN_OVERLAP_CHARS = 20
+# How context tokens are counted: "estimate" (no download, see count_tokens) or a tiktoken
+# encoding name such as cl100k_base, whose BPE file must be cached or downloadable
+CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER", "estimate")
+
+# CJK characters are about one token each; other text about four characters per token
+_CJK_RE = re.compile("[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]")
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    """The tiktoken encoding named by CONTEXT_TOKENIZER, loaded on first use; None to estimate."""
+    global _encoding
+    if CONTEXT_TOKENIZER == "estimate":
+        return None
+    with _encoding_lock:
+        if _encoding is None:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding(CONTEXT_TOKENIZER)
+            except Exception as e:
+                print(f"Could not load tokenizer '{CONTEXT_TOKENIZER}', estimating token counts: {str(e)}")
+                _encoding = False
+    return _encoding or None
+
+
+def count_tokens(text: str) -> int:
+    """Token count of `text`, estimated unless CONTEXT_TOKENIZER names a tiktoken encoding.
+
+    Neither is gemma's tokenizer; both are close enough for budgeting.
+    """
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    encoding = _get_encoding()
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:tokens])
+    used = 0.0
+    for position, char in enumerate(text):
+        used += 1 if _CJK_RE.match(char) else 0.25
+        if used > tokens:
+            return text[:position]
+    return text
+
+
+def _overlap(head: str, tail: str) -> int:
+    """Length of the longest suffix of `head` that starts `tail` (0 if shorter than _MIN_OVERLAP_CHARS)."""
+    for length in range(min(len(head), len(tail), 2 * CHUNK_OVERLAP), _MIN_OVERLAP_CHARS - 1, -1):
+        if head.endswith(tail[:length]):
+            return length
+    return 0
+
+
+def _label(metadata: dict) -> str:
+    parts = [str(metadata.get("source") or "unknown source")]
+    if metadata.get("page"):
+        parts.append(f"page {metadata['page']}")
+    if metadata.get("start") is not None and metadata.get("end") is not None:
+        parts.append(f"{int(metadata['start']) // 60}:{int(metadata['start']) % 60:02d}"
+                     f"-{int(metadata['end']) // 60}:{int(metadata['end']) % 60:02d}")
+    return ", ".join(parts)
+
+
+def merge_chunks(docs):
+    """Collapse ranked Documents into passages: [(label, text)] in rank order.
+
+    Identical texts are kept once. Chunks that follow each other in the same document
+    (consecutive chunk ids) are joined into one passage with their shared overlap
+    written once; a passage ranks where its best chunk ranked.
+    """
+    seen = set()
+    unique = []
+    for doc in docs:
+        if doc.page_content not in seen:
+            seen.add(doc.page_content)
+            unique.append(doc)
+
+    rank = {doc.id: position for position, doc in enumerate(unique)}
+    passages = []  # [best rank, metadata, text, last chunk id]
+    for doc in sorted(unique, key=lambda d: (str(d.metadata.get("document_id") or d.metadata.get("source")), int(d.id))):
+        previous = passages[-1] if passages else None
+        same_document = previous is not None and (
+            (previous[1].get("document_id") or previous[1].get("source"))
+            == (doc.metadata.get("document_id") or doc.metadata.get("source")))
+        if same_document and int(doc.id) == previous[3] + 1 and doc.metadata.get("page") == previous[1].get("page"):
+            shared = _overlap(previous[2], doc.page_content)
+            previous[2] = previous[2] + ("" if shared else " ") + doc.page_content[shared:]
+            previous[0] = min(previous[0], rank[doc.id])
+            previous[3] = int(doc.id)
+            if doc.metadata.get("end") is not None:
+                previous[1] = dict(previous[1], end=doc.metadata["end"])
+            continue
+        passages.append([rank[doc.id], dict(doc.metadata), doc.page_content, int(doc.id)])
+    return [(_label(metadata), text) for _, metadata, text, _ in sorted(passages, key=lambda p: p[0])]
+
+
+def build_context(docs, max_tokens: int = CHAT_CONTEXT_TOKENS):
+    """Pack retrieved Documents into at most `max_tokens` of prompt context.
+
+    Returns (context, tokens used). Passages are added best first; the first one that
+    does not fit is truncated if a useful amount of budget is left, and packing stops.
+    """
+    blocks = []
+    used = 0
+    for label, text in merge_chunks(docs):
+        block = f"[{label}]\n{text}"
+        tokens = count_tokens(block)
+        if used + tokens > max_tokens:
+            remaining = max_tokens - used
+            if remaining >= _MIN_PARTIAL_TOKENS:
+                block = truncate_to_tokens(block, remaining)
+                blocks.append(block)
+                used += count_tokens(block)
+            break
+        blocks.append(block)
+        used += tokens
+    return "\n\n".join(blocks), used
@@ -0,0 +1,122 @@
+# === embeddings ===
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from services.embedding_cache import EmbeddingCache, cache_key
+import os
+import requests
+import threading
+import time
+
+OLLAMA_SERVICE_URL = os.getenv("LLM_API_URL", "http://localhost:11434")
+# Point at a different server (e.g. a local stub) without moving the LLM
+EMBED_API_URL = os.getenv("EMBED_API_URL", OLLAMA_SERVICE_URL)
+EMBED_MODEL = os.getenv("EMBED_MODEL", "nomic-embed-text")
+# Chunks sent per /api/embed request
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+# Maximum embedding requests in flight across the whole process
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "3"))
+EMBED_TIMEOUT = float(os.getenv("EMBED_TIMEOUT", "120"))
+# Persistent vector cache keyed by (model, chunk text); set to an empty string to disable
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "services/cache/embeddings.db")
+
+# Status codes worth retrying: the server is busy or restarting
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class OllamaEmbeddingClient:
+    """Batched, pooled and concurrency-limited client for Ollama's /api/embed."""
+
+    def __init__(self, model: str = EMBED_MODEL, base_url: str = EMBED_API_URL,
+                 batch_size: int = EMBED_BATCH_SIZE, concurrency: int = EMBED_CONCURRENCY,
+                 max_retries: int = EMBED_MAX_RETRIES, timeout: float = EMBED_TIMEOUT,
+                 cache_path: str = EMBED_CACHE_PATH):
+        self.model = model
+        self.base_url = base_url.rstrip("/")
+        self.batch_size = max(1, batch_size)
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, concurrency))
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._slots = threading.BoundedSemaphore(max(1, concurrency))
+        self._executor = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="embed")
+        self.cache = EmbeddingCache(cache_path) if cache_path else None
+
+    def _embed_batch(self, texts):
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self._slots:
+                    response = self._session.post(
+                        f"{self.base_url}/api/embed",
+                        json={"model": self.model, "input": texts},
+                        timeout=self.timeout,
+                    )
+                if response.status_code in RETRY_STATUS and attempt < self.max_retries:
+                    raise requests.exceptions.RetryError(f"HTTP {response.status_code}")
+                response.raise_for_status()
+                embeddings = response.json().get("embeddings")
+                if not embeddings or len(embeddings) != len(texts):
+                    raise RuntimeError(f"Unexpected embedding response for {len(texts)} inputs")
+                return embeddings
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                    requests.exceptions.RetryError) as e:
+                if attempt >= self.max_retries:
+                    raise RuntimeError(f"Embedding request failed after {attempt + 1} attempts: {e}") from e
+                backoff = 0.5 * (2 ** attempt)
+                print(f"Embedding request failed ({e}); retrying in {backoff:.1f}s")
+                time.sleep(backoff)
+            except requests.exceptions.HTTPError as e:
+                raise RuntimeError(f"Embedding API error: {e.response.text}") from e
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        if not texts:
+            return []
+        if self.cache is None:
+            return self._embed_uncached(texts)
+
+        keys = [cache_key(self.model, text) for text in texts]
+        vectors = self.cache.get_many(keys)
+        # Embed each distinct uncached text once, even if it repeats in this call
+        missing = {key: text for key, text in zip(keys, texts) if key not in vectors}
+        if missing:
+            fresh = self._embed_uncached(list(missing.values()))
+            new_items = list(zip(missing.keys(), fresh))
+            self.cache.put_many(new_items)
+            vectors.update(new_items)
+        return [vectors[key] for key in keys]
+
+    def _embed_uncached(self, texts):
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) == 1:
+            return self._embed_batch(batches[0])
+        vectors = []
+        for batch_vectors in self._executor.map(self._embed_batch, batches):
+            vectors.extend(batch_vectors)
+        return vectors
+
+    def embed_query(self, text: str):
+        # Chat queries bypass the persistent cache: it holds chunk texts and has no
+        # eviction, so every distinct question would stay in it for good
+        return self._embed_batch([text])[0]
+
+    def cache_stats(self) -> dict:
+        return self.cache.stats() if self.cache is not None else {}
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self._session.close()
+
+
+_embedding_client = None
+_embedding_client_lock = threading.Lock()
+
+
+def get_embedding_client() -> OllamaEmbeddingClient:
+    global _embedding_client
+    with _embedding_client_lock:
+        if _embedding_client is None:
+            _embedding_client = OllamaEmbeddingClient()
+        return _embedding_client
@@ -0,0 +1,405 @@
+# === ingest ===
+# Ingestion pipelines run by the job manager. Each takes a JobContext followed by
+# the uploaded bytes and returns the JSON content for the endpoint's response.
+from services.ocr_module import extract_text
+from services.pdf_module import PDF_OCR_MODE, count_pages, iter_pdf_pages
+from services.preprocess import decode_image, light_preprocess_image, save_debug_image
+from services.llm_module import StreamingSummarizer, translate_context
+from services.chunking import split_into_chunks, split_segments_into_chunks
+from services.speech_to_text import embed_transcription, iter_transcription
+from services.vector_store import DEFAULT_COLLECTION, get_vector_store
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+import tempfile
+
+SNIPPET_MAX_LENGTH = 250
+# Chunks accumulated before each index update while a document streams in
+INGEST_EMBED_BATCH = int(os.getenv("INGEST_EMBED_BATCH", "64"))
+# Images OCR'd per worker task in /post-images
+OCR_BATCH_SIZE = int(os.getenv("OCR_BATCH_SIZE", "8"))
+
+
+class IngestError(Exception):
+    """Pipeline failure carrying the HTTP status and message for the client."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _snippet(text: str) -> str:
+    return text[:SNIPPET_MAX_LENGTH] + "..." if len(text) > SNIPPET_MAX_LENGTH else text
+
+
+def ocr_image_bytes(content: bytes, filename: str = None, profile: str = None):
+    """Decode, preprocess and OCR one image in memory; runs in an ingest worker process.
+
+    Returns (debug image path or None, text).
+    """
+    try:
+        preprocessed = light_preprocess_image(decode_image(content), profile)
+        debug_path = save_debug_image(preprocessed, filename or "image")
+    except Exception as e:
+        raise IngestError(500, f"Preprocessing failed: {str(e)}")
+    try:
+        text = extract_text(preprocessed)
+    except Exception as e:
+        raise IngestError(500, f"OCR or Embedding failed: {str(e)}")
+    return debug_path, text
+
+
+def ocr_image_batch(images, profile: str = None):
+    """OCR a batch of encoded images in memory; runs in an ingest worker process.
+
+    Returns [(text, error)] in input order so one unreadable image does not fail the batch.
+    """
+    results = []
+    for content in images:
+        try:
+            _, text = ocr_image_bytes(content, None, profile)
+            results.append(("" if text == "No text detected" else text, None))
+        except IngestError as e:
+            results.append(("", e.detail))
+    return results
+
+
+def _chunk_metadata(file_hash: str, collection: str, **fields) -> dict:
+    """Base metadata for every chunk of one upload; document_id is the file's sha256."""
+    return dict(fields, document_id=file_hash, collection=collection)
+
+
+def ingest_image(job, content: bytes, filename: str, profile: str = None, collection: str = DEFAULT_COLLECTION):
+    # Identical bytes were already OCR'd and embedded in this collection; skip the whole pipeline
+    file_hash = hashlib.sha256(content).hexdigest()
+    existing = get_vector_store().find_document(file_hash, collection)
+    if existing:
+        print(f"Duplicate upload of {filename} (sha256 {file_hash[:12]}); skipping OCR and embedding.")
+        return {
+            "message": "Identical file was already processed; existing content reused.",
+            "image_path": None,
+            "text_snippet": existing["info"].get("text_snippet", ""),
+            "document_id": file_hash,
+            "collection": collection,
+            "duplicate": True
+        }
+
+    job.progress("ocr")
+    preprocessed_file, extracted_text = job.run_cpu(ocr_image_bytes, content, filename, profile)
+
+    if not extracted_text or not extracted_text.strip():
+        text_snippet = "No text extracted from document."
+    else:
+        text_snippet = _snippet(extracted_text)
+
+    if not extracted_text.strip():
+        print("OCR resulted in empty text. Skipping embedding.")
+    else:
+        print(f"OCR successful. Length: {len(extracted_text)}. Embedding extracted text...")
+        job.progress("embedding")
+        try:
+            embed_transcription(
+                extracted_text,
+                file_hash=file_hash,
+                filename=filename,
+                info={"text_snippet": text_snippet},
+                metadata=_chunk_metadata(file_hash, collection, source=filename, type="image"),
+                collection=collection
+            )
+        except Exception as e:
+            print(f"Error during OCR or Embedding for image/PDF: {str(e)}")
+            raise IngestError(500, f"OCR or Embedding failed: {str(e)}")
+        print("Embedding of extracted image/PDF text successful. FAISS index updated in memory.")
+
+    return {
+        "message": "Uploaded file processed successfully and content embedded.",
+        "image_path": preprocessed_file,
+        "text_snippet": text_snippet,
+        "document_id": file_hash,
+        "collection": collection
+    }
+
+
+def ingest_image_batch(job, uploads, profile: str = None, collection: str = DEFAULT_COLLECTION):
+    """OCR many images in worker batches and add all their text in one index update."""
+    vector_store = get_vector_store()
+    results = []
+    todo = []  # (result index, file hash, bytes)
+    first = {}  # file hash -> result entry of its first copy in this batch
+    repeats = []  # (result entry, first copy's entry) for files repeated within the batch
+    for filename, content in uploads:
+        file_hash = hashlib.sha256(content).hexdigest()
+        entry = {"filename": filename, "document_id": file_hash, "text_snippet": "", "duplicate": False, "error": None}
+        results.append(entry)
+        if file_hash in first:
+            entry["duplicate"] = True
+            repeats.append((entry, first[file_hash]))
+            continue
+        first[file_hash] = entry
+        existing = vector_store.find_document(file_hash, collection)
+        if existing:
+            entry["duplicate"] = True
+            entry["text_snippet"] = existing["info"].get("text_snippet", "")
+            continue
+        todo.append((len(results) - 1, file_hash, content))
+
+    batches = [todo[i:i + OCR_BATCH_SIZE] for i in range(0, len(todo), OCR_BATCH_SIZE)]
+    futures = [job.submit_cpu(ocr_image_batch, [content for _, _, content in batch], profile) for batch in batches]
+
+    all_texts, all_metadatas, documents = [], [], []
+    done = 0
+    for batch, future in zip(batches, futures):
+        for (index, file_hash, _), (text, error) in zip(batch, future.result()):
+            entry = results[index]
+            done += 1
+            if error:
+                entry["error"] = error
+                continue
+            entry["text_snippet"] = _snippet(text) if text.strip() else "No text extracted from document."
+            if not text.strip():
+                continue
+            texts, metadatas = split_into_chunks(text, _chunk_metadata(file_hash, collection,
+                                                                       source=entry["filename"], type="image"))
+            all_texts.extend(texts)
+            all_metadatas.extend(metadatas)
+            documents.append((file_hash, entry["filename"], len(texts), {"text_snippet": entry["text_snippet"]}))
+        job.progress("ocr", images_done=done, image_count=len(todo))
+    # Repeated copies report what their first copy produced
+    for entry, original in repeats:
+        entry["text_snippet"] = original["text_snippet"]
+        entry["error"] = original["error"]
+
+    # One index update (and one log append) for the whole batch
+    job.progress("embedding")
+    try:
+        vector_store.add_texts(all_texts, all_metadatas)
+    except Exception as e:
+        raise IngestError(500, f"Embedding failed: {str(e)}")
+    for file_hash, filename, chunk_count, info in documents:
+        vector_store.register_document(file_hash, filename, chunk_count, info, collection)
+    print(f"Batch OCR: {len(uploads)} images, {len(todo)} processed, {len(all_texts)} chunks embedded.")
+
+    return {
+        "message": f"Processed {len(uploads)} images and embedded their content.",
+        "processed": len(documents),
+        "duplicates": sum(1 for entry in results if entry["duplicate"]),
+        "failed": sum(1 for entry in results if entry["error"]),
+        "collection": collection,
+        "results": results
+    }
+
+
+def capture_image(job, content: bytes, filename: str, profile: str = None):
+    job.progress("ocr")
+    preprocessed_file, extracted_text = job.run_cpu(ocr_image_bytes, content, filename, profile)
+    if not extracted_text.strip():
+        print("OCR resulted in empty text.")
+    else:
+        print(f"OCR successful. Length: {len(extracted_text)}.")
+
+    # Translate the extracted text
+    job.progress("translating")
+    translated_text = translate_context(extracted_text)
+    print(f"Translation attempted. Original length: {len(extracted_text)}, Translated length: {len(translated_text)}")
+    print(f"Translated text: {translated_text}")
+
+    # Generate text snippet
+    if not translated_text.strip() or translated_text == "No text detected in image.": # Check if translate_text modified the "empty" message
+        text_snippet = "No text detected or translated from image."
+    else:
+        text_snippet = _snippet(translated_text)
+
+    return {
+        "message": "Captured image processed and translated successfully.",
+        "image_path": preprocessed_file,
+        "translated_text": translated_text,
+        "text_snippet": text_snippet
+    }
+
+
+def ingest_pdf(job, pdf_content_bytes: bytes, filename: str, collection: str = DEFAULT_COLLECTION):
+    # Identical bytes were already extracted and embedded in this collection; skip the whole pipeline
+    file_hash = hashlib.sha256(pdf_content_bytes).hexdigest()
+    existing = get_vector_store().find_document(file_hash, collection)
+    if existing:
+        print(f"Duplicate upload of {filename} (sha256 {file_hash[:12]}); skipping extraction and embedding.")
+        return {
+            "message": "Identical PDF was already processed; existing content reused.",
+            "text_snippet": existing["info"].get("text_snippet", ""),
+            "page_count": existing["info"].get("page_count", 0),
+            "document_id": file_hash,
+            "collection": collection,
+            "duplicate": True
+        }
+
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temporary_pdf:
+        temporary_pdf.write(pdf_content_bytes)
+        pdf_path = temporary_pdf.name
+
+    vector_store = get_vector_store()
+    pending_texts, pending_metadatas = [], []
+    chunk_count = 0
+    ocr_pages = 0
+    text_snippet = ""
+
+    def flush():
+        nonlocal chunk_count
+        if pending_texts:
+            vector_store.add_texts(pending_texts, pending_metadatas)
+            chunk_count += len(pending_texts)
+            pending_texts.clear()
+            pending_metadatas.clear()
+
+    try:
+        num_pages = count_pages(pdf_path)
+        job.progress("extracting", pages_done=0, page_count=num_pages)
+        # Pages are extracted in parallel and chunked/embedded as they arrive, in page order;
+        # scanned pages are rasterized and OCR'd in the same worker pool
+        for page_num, page_text, ocr_used in iter_pdf_pages(pdf_path, job.submit_cpu, num_pages,
+                                                            max_inflight=2 * job.cpu_workers,
+                                                            ocr_fallback=PDF_OCR_MODE == "hybrid"):
+            if ocr_used:
+                ocr_pages += 1
+            job.progress("extracting", pages_done=page_num + 1, page_count=num_pages, ocr_pages=ocr_pages)
+            if not page_text.strip():
+                continue
+            if len(text_snippet) <= SNIPPET_MAX_LENGTH:
+                text_snippet += page_text
+            texts, metadatas = split_into_chunks(page_text, _chunk_metadata(
+                file_hash, collection,
+                source=filename,
+                page=page_num + 1,
+                type="pdf",
+                extraction="ocr" if ocr_used else "text"
+            ))
+            pending_texts.extend(texts)
+            pending_metadatas.extend(metadatas)
+            if len(pending_texts) >= INGEST_EMBED_BATCH:
+                flush()
+        flush()
+    except Exception as e:
+        print(f"Error processing PDF directly: {str(e)}")
+        raise IngestError(500, f"Failed to process PDF: {str(e)}")
+    finally:
+        os.remove(pdf_path)
+
+    if not chunk_count:
+        raise IngestError(400, "No text could be extracted from the PDF.")
+
+    text_snippet = _snippet(text_snippet)
+    vector_store.register_document(file_hash, filename, chunk_count,
+                                   {"text_snippet": text_snippet, "page_count": num_pages, "ocr_pages": ocr_pages},
+                                   collection)
+    print(f"PDF processed: {num_pages} pages ({ocr_pages} via OCR), {chunk_count} chunks embedded.")
+
+    return {
+        "message": "PDF processed successfully, text extracted and embedded.",
+        "text_snippet": text_snippet,
+        "page_count": num_pages,
+        "ocr_pages": ocr_pages,
+        "document_id": file_hash,
+        "collection": collection
+    }
+
+
+def ingest_audio(job, content: bytes, filename: str, collection: str = DEFAULT_COLLECTION):
+    # Identical bytes were already transcribed, summarized and embedded in this collection; skip the whole pipeline
+    file_hash = hashlib.sha256(content).hexdigest()
+    vector_store = get_vector_store()
+    existing = vector_store.find_document(file_hash, collection)
+    if existing:
+        print(f"Duplicate upload of {filename} (sha256 {file_hash[:12]}); skipping transcription and embedding.")
+        return {
+            "message": "Identical audio was already processed; existing content reused.",
+            "summary": existing["info"].get("summary", ""),
+            "segments": [],
+            "document_id": file_hash,
+            "collection": collection,
+            "duplicate": True
+        }
+
+    suffix = os.path.splitext(filename or "")[-1].lower()
+    if not suffix:
+        suffix = '.mp3'
+
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temporary_audio_file:
+        temporary_audio_file.write(content)
+        temp_audio_path = temporary_audio_file.name
+    print(f"Temporary audio file saved at: {temp_audio_path}")
+
+    summarizer = StreamingSummarizer(
+        lambda done, total: job.progress("summarizing", parts_done=done, part_count=total)
+    )
+    segments = []
+    unchunked = []  # segments not yet in a finished chunk (the last chunk may still grow)
+    pending_texts, pending_metadatas = [], []
+    chunk_count = 0
+    chunk_metadata = _chunk_metadata(file_hash, collection, source=filename, type="audio")
+
+    def flush():
+        nonlocal chunk_count
+        if pending_texts:
+            vector_store.add_texts(pending_texts, pending_metadatas)
+            chunk_count += len(pending_texts)
+            pending_texts.clear()
+            pending_metadatas.clear()
+
+    try:
+        # 1. Transcribe audio window by window; each window's text is handed to the
+        # summarizer and chunked for the index as soon as it is ready, so summarizing
+        # and embedding overlap transcription
+        job.progress("transcribing")
+        for index, window_count, window_segments in iter_transcription(temp_audio_path, job.submit_cpu,
+                                                                       max_inflight=2 * job.cpu_workers):
+            segments.extend(window_segments)
+            summarizer.feed(" ".join(segment["text"] for segment in window_segments))
+            job.progress("transcribing", windows_done=index + 1, window_count=window_count,
+                         segments=list(segments))
+
+            unchunked.extend(window_segments)
+            texts, metadatas = split_segments_into_chunks(unchunked, chunk_metadata)
+            if len(texts) > 1:
+                # Every chunk but the last is final; keep the last one's segments for the next window
+                pending_texts.extend(texts[:-1])
+                pending_metadatas.extend(metadatas[:-1])
+                unchunked = [segment for segment in unchunked if segment["start"] >= metadatas[-1]["start"]]
+                if len(pending_texts) >= INGEST_EMBED_BATCH:
+                    flush()
+        transcript = " ".join(segment["text"] for segment in segments)
+        print(f"Transcription successful. Length: {len(transcript)}")
+
+        texts, metadatas = split_segments_into_chunks(unchunked, chunk_metadata)
+        pending_texts.extend(texts)
+        pending_metadatas.extend(metadatas)
+
+        # 2. Embed the remaining chunks while the summary is finished
+        job.progress("summarizing")
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="audio-embed") as embedder:
+            embedded = embedder.submit(flush)
+            summary = summarizer.finish()
+            embedded.result()
+        print(f"Summarization of transcript successful. {chunk_count} transcript chunks embedded.")
+    except Exception as e:
+        print(f"Error in /post-audio: {str(e)}")
+        raise IngestError(500, f"Error processing audio: {str(e)}")
+    finally:
+        # Clean up the temporary audio file
+        if os.path.exists(temp_audio_path):
+            os.remove(temp_audio_path)
+            print(f"Temporary audio file {temp_audio_path} deleted.")
+
+    vector_store.register_document(file_hash, filename, chunk_count, {
+        "text_snippet": _snippet(transcript),
+        "summary": summary,
+        "duration": segments[-1]["end"] if segments else 0.0
+    }, collection)
+
+    return {
+        "message": "Audio processed, summarized and embedded successfully.",
+        "summary": summary,
+        "segments": segments,
+        "chunk_count": chunk_count,
+        "document_id": file_hash,
+        "collection": collection
+    }
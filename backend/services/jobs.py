@@ -0,0 +1,227 @@
+# === jobs ===
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+
+# Threads that run ingestion pipelines (I/O, embedding, LLM calls)
+INGEST_THREAD_WORKERS = int(os.getenv("INGEST_THREAD_WORKERS", "4"))
+# Processes for CPU-bound OCR/Whisper work; each keeps its own warm models (0 runs them in-thread)
+INGEST_PROCESS_WORKERS = int(os.getenv("INGEST_PROCESS_WORKERS", "2"))
+# Finished jobs kept for status polling
+JOB_HISTORY = int(os.getenv("JOB_HISTORY", "200"))
+
+
+def _init_worker():
+    """Load models once per worker process if warm-up is configured."""
+    from services.ocr_module import OCR_WARMUP, warm_up_ocr
+    from services.speech_to_text import WHISPER_PRELOAD, get_whisper_model
+    if OCR_WARMUP:
+        warm_up_ocr()
+    if WHISPER_PRELOAD:
+        get_whisper_model()
+
+
+def _call_in_worker(fn, args):
+    from services.ocr_module import get_ocr_stats
+    value = fn(*args)
+    return os.getpid(), value, get_ocr_stats()
+
+
+def _noop():
+    return os.getpid()
+
+
+class JobContext:
+    """Handle passed to a pipeline so it can report progress and offload CPU work."""
+
+    def __init__(self, manager, job_id: str):
+        self._manager = manager
+        self.job_id = job_id
+
+    def progress(self, stage: str, **fields):
+        self._manager.update(self.job_id, stage=stage, **fields)
+
+    def run_cpu(self, fn, *args):
+        return self._manager.run_cpu(fn, *args)
+
+    def submit_cpu(self, fn, *args):
+        return self._manager.submit_cpu(fn, *args)
+
+    @property
+    def cpu_workers(self) -> int:
+        return self._manager.cpu_workers
+
+
+class JobManager:
+    """Queue of ingestion jobs run on a thread pool, with CPU stages on a process pool."""
+
+    def __init__(self, thread_workers: int = INGEST_THREAD_WORKERS, process_workers: int = INGEST_PROCESS_WORKERS):
+        self._threads = ThreadPoolExecutor(max_workers=max(1, thread_workers), thread_name_prefix="ingest")
+        self._process_workers = max(0, process_workers)
+        self._processes = self._new_process_pool() if self._process_workers else None
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._worker_ocr_stats = {}
+
+    def _new_process_pool(self) -> ProcessPoolExecutor:
+        # spawn: paddle, torch and faiss hold threads that do not survive fork
+        return ProcessPoolExecutor(
+            max_workers=self._process_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+
+    def _replace_broken_pool(self, broken: ProcessPoolExecutor):
+        """Swap in a fresh process pool after a worker died (OOM, segfault), once per broken pool."""
+        with self._lock:
+            if self._processes is not broken:
+                return
+            self._processes = self._new_process_pool()
+        print("An ingest worker process died; started a new process pool.")
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, kind: str, filename: str, pipeline, *args):
+        """Queue `pipeline(context, *args)`; returns (job_id, concurrent future of its result)."""
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._jobs[job_id] = {
+                "id": job_id,
+                "kind": kind,
+                "filename": filename,
+                "status": "queued",
+                "stage": "queued",
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "result": None,
+                "error": None,
+                "status_code": None,
+            }
+            self._trim_history()
+        future = self._threads.submit(self._run, job_id, pipeline, args)
+        return job_id, future
+
+    def _run(self, job_id: str, pipeline, args):
+        self.update(job_id, status="running", stage="started", started_at=time.time())
+        try:
+            result = pipeline(JobContext(self, job_id), *args)
+        except Exception as e:
+            self.update(job_id, status="failed", stage="failed", finished_at=time.time(),
+                        error=getattr(e, "detail", str(e)), status_code=getattr(e, "status_code", 500))
+            raise
+        self.update(job_id, status="done", stage="done", finished_at=time.time(), result=result, status_code=200)
+        return result
+
+    def _trim_history(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job["status"] in ("done", "failed")]
+        for job_id in finished[:max(0, len(finished) - JOB_HISTORY)]:
+            del self._jobs[job_id]
+
+    def update(self, job_id: str, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def get(self, job_id: str):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def submit_cpu(self, fn, *args) -> Future:
+        """Start a CPU-bound step in the process pool; returns a future of its value.
+
+        With the process pool disabled the step runs inline and the future is already done.
+        If a worker dies (OOM, segfault) the steps that were running on that pool fail,
+        since the pool cannot tell which one killed it, and the pool is replaced so
+        later steps run normally.
+        """
+        result = Future()
+        if self._processes is None:
+            try:
+                result.set_result(fn(*args))
+            except Exception as e:
+                result.set_exception(e)
+            return result
+        with self._lock:
+            pool = self._processes
+
+        def _unwrap(worker_future):
+            try:
+                pid, value, ocr_stats = worker_future.result()
+            except BrokenProcessPool as e:
+                self._replace_broken_pool(pool)
+                result.set_exception(e)
+                return
+            except Exception as e:
+                result.set_exception(e)
+                return
+            with self._lock:
+                self._worker_ocr_stats[pid] = ocr_stats
+            result.set_result(value)
+
+        try:
+            worker_future = pool.submit(_call_in_worker, fn, args)
+        except BrokenProcessPool:
+            # Broke before its failure was noticed; this step was never started, so use a fresh pool
+            self._replace_broken_pool(pool)
+            with self._lock:
+                pool = self._processes
+            worker_future = pool.submit(_call_in_worker, fn, args)
+        worker_future.add_done_callback(_unwrap)
+        return result
+
+    def run_cpu(self, fn, *args):
+        """Run a CPU-bound step in the process pool (or inline when it is disabled)."""
+        return self.submit_cpu(fn, *args).result()
+
+    @property
+    def cpu_workers(self) -> int:
+        return max(1, self._process_workers)
+
+    def warm_up(self):
+        """Start every worker process now so model loading happens before the first upload."""
+        if self._processes is None:
+            _init_worker()
+            return
+        futures = [self._processes.submit(_noop) for _ in range(self._process_workers)]
+        for future in futures:
+            future.result()
+
+    def ocr_stats(self) -> dict:
+        """OCR counters summed across worker processes."""
+        if self._processes is None:
+            from services.ocr_module import get_ocr_stats
+            return get_ocr_stats()
+        merged = {}
+        with self._lock:
+            snapshots = list(self._worker_ocr_stats.values())
+        for snapshot in snapshots:
+            for lang, entry in snapshot.items():
+                total = merged.setdefault(lang, {key: 0 for key in entry if not key.startswith("avg_")})
+                for key in total:
+                    total[key] += entry[key]
+        for entry in merged.values():
+            entry["avg_load_seconds"] = entry["load_seconds"] / entry["engines_loaded"] if entry["engines_loaded"] else 0.0
+            entry["avg_inference_seconds"] = entry["inference_seconds"] / entry["inference_calls"] if entry["inference_calls"] else 0.0
+        return merged
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return {"jobs": counts, "thread_workers": self._threads._max_workers, "process_workers": self._process_workers}
+
+    def shutdown(self):
+        self._threads.shutdown(wait=True)
+        if self._processes is not None:
+            self._processes.shutdown(wait=True)
+
+
+def init_job_manager() -> JobManager:
+    return JobManager()
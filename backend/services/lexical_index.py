@@ -0,0 +1,141 @@
+# === lexical_index ===
+from collections import Counter
+import heapq
+import math
+import os
+import re
+import threading
+
+# BM25 term-frequency saturation and length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Query terms found in more than this share of chunks are skipped when the query has
+# rarer terms: they barely change the ranking but have the longest posting lists
+BM25_MAX_DF_RATIO = float(os.getenv("BM25_MAX_DF_RATIO", "0.1"))
+# Below this many chunks every query term is scored; posting lists are short anyway
+BM25_PRUNE_MIN_CHUNKS = int(os.getenv("BM25_PRUNE_MIN_CHUNKS", "1000"))
+
+# Chinese/Japanese/Korean runs are indexed as character unigrams and bigrams, since
+# PaddleOCR's lang='ch' output has no spaces between words
+_CJK = "぀-ヿ㐀-䶿一-鿿가-힯豈-﫿"
+_TOKEN_RE = re.compile(rf"[{_CJK}]+|[^\W_{_CJK}]+(?:[-_./][^\W_{_CJK}]+)*")
+_CJK_RE = re.compile(rf"[{_CJK}]")
+_SPLIT_RE = re.compile(r"[-_./]")
+# Function words that are neither indexed nor searched
+_STOPWORDS = frozenset("""
+a an and are as at be been but by can could did do does for from had has have he her his how i if in into is it
+its me my no not of on or our she so than that the their them then there these they this to too was we were what
+when where which who why will with would you your
+的 了 是 在 和 与 及 或 就 都 也 而 着 过 吗 呢 吧 啊 之 其 这 那 个 们 我 你 他 她 它 有 被 把 给 对 从 并 但
+の に は を が と で も た し て な だ す る
+""".split())
+
+
+def tokenize(text: str):
+    """Lowercased terms of `text`: words, numbers, CJK unigrams and bigrams.
+
+    Identifiers such as "AB-1234" or "v2.1" are kept whole as well as split into
+    their parts, so exact part numbers match precisely.
+    """
+    tokens = []
+    for match in _TOKEN_RE.finditer(text.lower()):
+        token = match.group(0)
+        if _CJK_RE.match(token):
+            tokens.extend(char for char in token if char not in _STOPWORDS)
+            tokens.extend(token[i:i + 2] for i in range(len(token) - 1))
+        elif token not in _STOPWORDS:
+            tokens.append(token)
+            parts = _SPLIT_RE.split(token)
+            if len(parts) > 1:
+                tokens.extend(part for part in parts if part and part not in _STOPWORDS)
+    return tokens
+
+
+class BM25Index:
+    """In-memory inverted index over chunk texts, keyed by FAISS vector id.
+
+    Built from the chunk store in the background at startup and updated as chunks
+    are added, so queries never touch disk. The lock is held only to copy the
+    posting lists a query needs; scoring happens outside it.
+    """
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B, max_df_ratio: float = BM25_MAX_DF_RATIO,
+                 prune_min_chunks: int = BM25_PRUNE_MIN_CHUNKS):
+        self.k1 = k1
+        self.b = b
+        self.max_df_ratio = max_df_ratio
+        self.prune_min_chunks = prune_min_chunks
+        self._postings = {}   # term -> {chunk id: term frequency}
+        self._lengths = {}    # chunk id -> number of terms
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def add(self, ids, texts):
+        tokenized = [(int(i), Counter(tokenize(text))) for i, text in zip(ids, texts)]
+        with self._lock:
+            for chunk_id, counts in tokenized:
+                if chunk_id in self._lengths:
+                    continue
+                length = sum(counts.values())
+                self._lengths[chunk_id] = length
+                self._total_length += length
+                for term, frequency in counts.items():
+                    self._postings.setdefault(term, {})[chunk_id] = frequency
+
+    def search(self, query: str, k: int, allowed=None):
+        """Top-k (chunk id, score) for `query`, optionally only among the ids in `allowed`.
+
+        Once the index holds prune_min_chunks chunks, terms in more than max_df_ratio
+        of them are not scored if the query has at least one rarer term; a query made
+        only of common terms scores all of them.
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        with self._lock:
+            count = len(self._lengths)
+            if not count:
+                return []
+            average_length = self._total_length / count
+            kept = [term for term in terms if term in self._postings]
+            if not kept:
+                return []
+            if count >= self.prune_min_chunks:
+                rare = [term for term in kept if len(self._postings[term]) <= self.max_df_ratio * count]
+                kept = rare or kept
+            matches = []  # (document frequency, copy of the term's postings)
+            for term in kept:
+                postings = self._postings[term]
+                if allowed is not None and len(allowed) < len(postings):
+                    matches.append((len(postings), {chunk_id: postings[chunk_id] for chunk_id in allowed
+                                                    if chunk_id in postings}))
+                else:
+                    matches.append((len(postings), postings.copy()))
+
+        # Chunk lengths are only ever inserted, so reading them without the lock is safe
+        lengths = self._lengths
+        scores = {}
+        for df, postings in matches:
+            idf = math.log(1 + (count - df + 0.5) / (df + 0.5))
+            for chunk_id, frequency in postings.items():
+                if allowed is not None and chunk_id not in allowed:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * lengths[chunk_id] / average_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"chunks": len(self._lengths), "terms": len(self._postings)}
+
+
+def reciprocal_rank_fusion(rankings, k: int, constant: int = 60):
+    """Merge ranked id lists: each id scores sum(1 / (constant + rank)) over the lists it appears in."""
+    scores = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (constant + rank)
+    return [chunk_id for chunk_id, _ in sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]]
@@ -0,0 +1,75 @@
+# === llm_cache ===
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+
+def llm_cache_key(model: str, task: str, version: int, text: str) -> str:
+    text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return hashlib.sha256(f"{model}\0{task}\0{version}\0{text_hash}".encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """Persistent, size-bounded map of (model, task, template version, input hash) -> LLM output.
+
+    Least recently used entries are evicted once `max_entries` is exceeded.
+    """
+
+    def __init__(self, db_path: str, max_entries: int):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_results (
+                    key TEXT PRIMARY KEY,
+                    task TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    last_used REAL NOT NULL
+                )""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS llm_results_last_used ON llm_results (last_used)")
+
+    def get(self, key: str):
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT response FROM llm_results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE llm_results SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, task: str, response: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_results (key, task, response, last_used) VALUES (?, ?, ?, ?)",
+                (key, task, response, time.time()))
+            excess = self._conn.execute("SELECT COUNT(*) FROM llm_results").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM llm_results WHERE key IN "
+                    "(SELECT key FROM llm_results ORDER BY last_used LIMIT ?)", (excess,))
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM llm_results").fetchone()[0]
+            total = self.hits + self.misses
+            return {
+                "entries": entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
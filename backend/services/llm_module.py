@@ -1,47 +1,166 @@
 # === llm_module ===
-import requests
+from services.llm_cache import LLMCache, llm_cache_key
+from services.ollama_client import LLM_MODEL, OllamaError, get_ollama_client
+from concurrent.futures import ThreadPoolExecutor
+from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langdetect import detect
-import json
 import os
+import threading
 
-def query_llm(prompt):
-    llm_api_url = os.getenv("LLM_API_URL", "http://localhost:11434")
-    
-    response = requests.post(
-        f"{llm_api_url}/api/generate",
-        json={
-            "model": "gemma3:4b",
-            "prompt": prompt,
-            "stream": False,
-        }
-    )
+# Persistent cache of translation/summarization results; set to an empty string to disable
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "services/cache/llm.db")
+# Cached results kept before the least recently used are evicted
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2000"))
+# Texts longer than this (in characters) are summarized map-reduce style, one piece at a time;
+# keeps each prompt well inside gemma3:4b's context window
+SUMMARIZE_CHUNK_CHARS = int(os.getenv("SUMMARIZE_CHUNK_CHARS", "6000"))
+# Piece summaries generated at once (match OLLAMA_NUM_PARALLEL on the Ollama server)
+SUMMARIZE_CONCURRENCY = int(os.getenv("SUMMARIZE_CONCURRENCY", "2"))
+
+# Bump a template's version whenever its wording changes so stale results are not reused
+TRANSLATE_PROMPT_VERSION = 1
+TRANSLATE_PROMPT = """You are an assistant for translation tasks. 
+        Use the following pieces of retrieved context \n\n---\n{context}\n to translate it in english. 
+        IF ITS IN CHINESE, TRANSLATE IN ENGLISH. DO NOT GIVE CHINESE RESULTS. DON'T HALLUCINATE AND DON'T MAKE UP ANYTHING."""
+SUMMARIZE_PROMPT_VERSION = 1
+SUMMARIZE_PROMPT = """You are an assistant for summarization tasks. 
+        Use the following pieces of retrieved context \n\n---\n{context}\n to summarize it in english. 
+        DON'T HALLUCINATE AND DON'T MAKE UP ANYTHING. summarize informatively based on the above context"""
+SUMMARIZE_PART_PROMPT_VERSION = 1
+SUMMARIZE_PART_PROMPT = """You are an assistant for summarization tasks. 
+        The following text is one consecutive part of a longer transcript \n\n---\n{context}\n summarize this part in english. 
+        Keep names, numbers and decisions. DON'T HALLUCINATE AND DON'T MAKE UP ANYTHING."""
+COMBINE_SUMMARIES_PROMPT_VERSION = 1
+COMBINE_SUMMARIES_PROMPT = """You are an assistant for summarization tasks. 
+        The following are summaries of consecutive parts of one transcript, in order \n\n---\n{context}\n combine them into a single summary in english. 
+        DON'T HALLUCINATE AND DON'T MAKE UP ANYTHING. summarize informatively based on the above context"""
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+_summary_pool = None
+_summary_splitter = RecursiveCharacterTextSplitter(chunk_size=SUMMARIZE_CHUNK_CHARS, chunk_overlap=200)
+
+
+def get_llm_cache():
+    global _llm_cache
+    if not LLM_CACHE_PATH:
+        return None
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            _llm_cache = LLMCache(LLM_CACHE_PATH, LLM_CACHE_MAX_ENTRIES)
+        return _llm_cache
+
+
+def get_summary_pool() -> ThreadPoolExecutor:
+    """Shared pool that bounds concurrent piece summaries across all requests."""
+    global _summary_pool
+    with _llm_cache_lock:
+        if _summary_pool is None:
+            _summary_pool = ThreadPoolExecutor(max_workers=max(1, SUMMARIZE_CONCURRENCY),
+                                               thread_name_prefix="summarize")
+        return _summary_pool
+
+
+def get_llm_cache_stats() -> dict:
+    cache = get_llm_cache()
+    return cache.stats() if cache is not None else {}
+
+
+def query_llm(prompt, timeout=None):
+    # Blocking call for ingest jobs and threadpool code; async endpoints await the client directly
     try:
-        response.raise_for_status()
-        response_data = response.json()
-    except requests.exceptions.HTTPError as e:
-        raise RuntimeError(f"LLM API error: {e.response.text}") from e
-    except json.JSONDecodeError:
-        raise RuntimeError("Invalid JSON response from LLM API")
-    
-    if "response" not in response_data:
-        raise RuntimeError(f"Unexpected LLM response format: {response_data}")
-    
-    return response_data["response"]
+        return get_ollama_client().generate_sync(prompt, timeout)
+    except OllamaError as e:
+        raise RuntimeError(str(e)) from e
+
+def cached_query_llm(task: str, version: int, template: str, context: str) -> str:
+    """query_llm for `template` filled with `context`, reusing the stored result for identical input."""
+    cache = get_llm_cache()
+    if cache is None:
+        return query_llm(template.format(context=context))
+    key = llm_cache_key(LLM_MODEL, task, version, context)
+    response = cache.get(key)
+    if response is None:
+        response = query_llm(template.format(context=context))
+        cache.put(key, task, response)
+    else:
+        print(f"LLM cache hit for {task}.")
+    return response
 
 def translate_context(context: str) -> str:
     try:
-        prompt = f"""You are an assistant for translation tasks. 
-        Use the following pieces of retrieved context \n\n---\n{context}\n to translate it in english. 
-        IF ITS IN CHINESE, TRANSLATE IN ENGLISH. DO NOT GIVE CHINESE RESULTS. DON'T HALLUCINATE AND DON'T MAKE UP ANYTHING."""
-        return query_llm(prompt)
+        return cached_query_llm("translate", TRANSLATE_PROMPT_VERSION, TRANSLATE_PROMPT, context)
     except Exception as e:
         raise RuntimeError(f"Translation failed: {str(e)}") from e
 
-def summarize_context(context: str) -> str:
-    try:
-        prompt = f"""You are an assistant for summarization tasks. 
-        Use the following pieces of retrieved context \n\n---\n{context}\n to summarize it in english. 
-        DON'T HALLUCINATE AND DON'T MAKE UP ANYTHING. summarize informatively based on the above context"""
-        return query_llm(prompt)
-    except Exception as e:
-        raise RuntimeError(f"Summarization failed: {str(e)}") from e
\ No newline at end of file
+def summarize_part(part: str) -> str:
+    return cached_query_llm("summarize_part", SUMMARIZE_PART_PROMPT_VERSION, SUMMARIZE_PART_PROMPT, part)
+
+def summarize_parts(parts, progress=None):
+    """Summarize consecutive text parts concurrently, keeping their order."""
+    pool = get_summary_pool()
+    futures = [pool.submit(summarize_part, part) for part in parts]
+    summaries = []
+    for future in futures:
+        summaries.append(future.result())
+        if progress:
+            progress(len(summaries), len(parts))
+    return summaries
+
+def combine_summaries(summaries, progress=None) -> str:
+    """Reduce ordered part summaries to one, in further rounds while they exceed one prompt."""
+    while True:
+        combined = "\n\n".join(summaries)
+        if len(combined) <= SUMMARIZE_CHUNK_CHARS or len(summaries) == 1:
+            break
+        parts = _summary_splitter.split_text(combined)
+        print(f"Summarizing {len(parts)} parts of {len(combined)} characters.")
+        shorter = summarize_parts(parts, progress)
+        # Stop if a round failed to shrink the text, rather than looping forever
+        if len("\n\n".join(shorter)) >= len(combined):
+            break
+        summaries = shorter
+    return cached_query_llm("combine_summaries", COMBINE_SUMMARIES_PROMPT_VERSION,
+                            COMBINE_SUMMARIES_PROMPT, combined)
+
+class StreamingSummarizer:
+    """Summarize text that arrives piece by piece, map-reduce style.
+
+    Every SUMMARIZE_CHUNK_CHARS of fed text is summarized on the shared pool right away
+    (map), so by the time the last piece arrives only the tail and combine_summaries
+    (reduce) remain. Text that never exceeds SUMMARIZE_CHUNK_CHARS gets one prompt.
+    `progress(parts_done, part_count)` is called as part summaries finish.
+    """
+
+    def __init__(self, progress=None):
+        self.progress = progress
+        self._buffer = ""
+        self._futures = []
+
+    def feed(self, text: str):
+        self._buffer = f"{self._buffer} {text}".strip() if self._buffer else text.strip()
+        while len(self._buffer) > SUMMARIZE_CHUNK_CHARS:
+            # Cut at the last sentence or word break inside the limit
+            cut = self._buffer.rfind(". ", 0, SUMMARIZE_CHUNK_CHARS) + 1
+            if cut < SUMMARIZE_CHUNK_CHARS // 2:
+                cut = self._buffer.rfind(" ", 0, SUMMARIZE_CHUNK_CHARS)
+            if cut <= 0:
+                cut = SUMMARIZE_CHUNK_CHARS
+            part, self._buffer = self._buffer[:cut].strip(), self._buffer[cut:].strip()
+            self._futures.append(get_summary_pool().submit(summarize_part, part))
+
+    def finish(self) -> str:
+        try:
+            if not self._futures:
+                return cached_query_llm("summarize", SUMMARIZE_PROMPT_VERSION, SUMMARIZE_PROMPT, self._buffer)
+            if self._buffer:
+                self._futures.append(get_summary_pool().submit(summarize_part, self._buffer))
+                self._buffer = ""
+            summaries = []
+            for future in self._futures:
+                summaries.append(future.result())
+                if self.progress:
+                    self.progress(len(summaries), len(self._futures))
+            return combine_summaries(summaries, self.progress)
+        except Exception as e:
+            raise RuntimeError(f"Summarization failed: {str(e)}") from e
@@ -1,16 +1,116 @@
 # === ocr_module ===
 from paddleocr import PaddleOCR
+from contextlib import contextmanager
+import numpy as np
 import os
+import queue
+import threading
+import time
 
-def extract_text(image_path: str, text_save_path: str = None, lang='ch') -> str:
-    ocr = PaddleOCR(use_angle_cls=True, lang=lang)
-    result = ocr.ocr(image_path, cls=True)
+# Maximum number of resident PaddleOCR engines per language
+OCR_POOL_SIZE = max(1, int(os.getenv("OCR_POOL_SIZE", "2")))
+# Load engines for OCR_WARMUP_LANGS at startup instead of on the first request
+OCR_WARMUP = os.getenv("OCR_WARMUP", "false").lower() in ("1", "true", "yes")
+# Languages to load at startup when warm-up is enabled (comma separated)
+OCR_WARMUP_LANGS = [lang.strip() for lang in os.getenv("OCR_WARMUP_LANGS", "ch").split(",") if lang.strip()]
+
+_pools = {}        # lang -> queue.Queue of idle engines
+_created = {}      # lang -> number of engines constructed so far
+_pools_lock = threading.Lock()
+_stats = {}        # lang -> timing counters
+_stats_lock = threading.Lock()
+
+
+def _record(lang: str, **increments):
+    with _stats_lock:
+        entry = _stats.setdefault(lang, {
+            "engines_loaded": 0,
+            "load_seconds": 0.0,
+            "inference_calls": 0,
+            "inference_seconds": 0.0,
+            "wait_seconds": 0.0,
+        })
+        for key, value in increments.items():
+            entry[key] += value
+
+
+def _load_engine(lang: str) -> PaddleOCR:
+    start = time.perf_counter()
+    engine = PaddleOCR(use_angle_cls=True, lang=lang)
+    elapsed = time.perf_counter() - start
+    _record(lang, engines_loaded=1, load_seconds=elapsed)
+    print(f"PaddleOCR engine for lang='{lang}' loaded in {elapsed:.2f}s")
+    return engine
+
+
+@contextmanager
+def ocr_engine(lang: str = 'ch'):
+    """Borrow a resident PaddleOCR engine for `lang`, loading one lazily if the pool has room.
+
+    Engines are not thread-safe, so each one is handed to a single caller at a time;
+    callers block once OCR_POOL_SIZE engines are busy.
+    """
+    with _pools_lock:
+        pool = _pools.setdefault(lang, queue.Queue())
+        try:
+            engine = pool.get_nowait()
+        except queue.Empty:
+            engine = None
+            can_create = _created.get(lang, 0) < OCR_POOL_SIZE
+            if can_create:
+                _created[lang] = _created.get(lang, 0) + 1
+
+    if engine is None:
+        if can_create:
+            try:
+                engine = _load_engine(lang)
+            except Exception:
+                with _pools_lock:
+                    _created[lang] -= 1
+                raise
+        else:
+            wait_start = time.perf_counter()
+            engine = pool.get()
+            _record(lang, wait_seconds=time.perf_counter() - wait_start)
+
+    try:
+        yield engine
+    finally:
+        pool.put(engine)
+
+
+def warm_up_ocr(langs=None):
+    """Load one engine per language and run a dummy inference so the first request is fast."""
+    for lang in langs or OCR_WARMUP_LANGS:
+        with ocr_engine(lang) as engine:
+            engine.ocr(np.full((32, 32, 3), 255, dtype=np.uint8), cls=True)
+        print(f"OCR warm-up complete for lang='{lang}'")
+
+
+def get_ocr_stats() -> dict:
+    with _stats_lock:
+        stats = {lang: dict(entry) for lang, entry in _stats.items()}
+    for lang, entry in stats.items():
+        entry["pool_size"] = OCR_POOL_SIZE
+        entry["avg_load_seconds"] = entry["load_seconds"] / entry["engines_loaded"] if entry["engines_loaded"] else 0.0
+        entry["avg_inference_seconds"] = entry["inference_seconds"] / entry["inference_calls"] if entry["inference_calls"] else 0.0
+    return stats
+
+
+def extract_text(image, text_save_path: str = None, lang='ch') -> str:
+    """OCR a decoded image array (or an image file path)."""
+    with ocr_engine(lang) as ocr:
+        start = time.perf_counter()
+        result = ocr.ocr(image, cls=True)
+        elapsed = time.perf_counter() - start
+    _record(lang, inference_calls=1, inference_seconds=elapsed)
+    print(f"OCR inference took {elapsed:.2f}s")
 
     extracted_text = ""
-    
+
     if not result:
         return "No text detected"
-        
+
     try:
         for line in result:
             if line:
@@ -28,4 +128,4 @@ def extract_text(image_path: str, text_save_path: str = None, lang='ch') -> str:
         with open(text_save_path, "w", encoding="utf-8") as f:
             f.write(extracted_text)
 
-    return extracted_text
\ No newline at end of file
+    return extracted_text
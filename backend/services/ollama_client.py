@@ -0,0 +1,191 @@
+# === ollama_client ===
+from services.embeddings import OLLAMA_SERVICE_URL, RETRY_STATUS
+import asyncio
+import concurrent.futures
+import httpx
+import json
+import os
+import threading
+
+LLM_MODEL = os.getenv("LLM_MODEL", "gemma3:4b")
+# How long Ollama keeps the model loaded after a request ("-1" pins it until the server restarts)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Generations in flight across the whole process; extra requests wait their turn
+OLLAMA_CONCURRENCY = int(os.getenv("OLLAMA_CONCURRENCY", "4"))
+OLLAMA_MAX_RETRIES = int(os.getenv("OLLAMA_MAX_RETRIES", "2"))
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+# Seconds without a byte from Ollama before a generation is abandoned
+OLLAMA_READ_TIMEOUT = float(os.getenv("OLLAMA_READ_TIMEOUT", "300"))
+# Upper bound in seconds on a blocking generate_sync call, including the wait for a free slot
+OLLAMA_SYNC_TIMEOUT = float(os.getenv("OLLAMA_SYNC_TIMEOUT", "600"))
+
+
+class OllamaError(RuntimeError):
+    pass
+
+
+class OllamaClient:
+    """Async client for Ollama's /api/generate shared by chat, translation and summarization.
+
+    One pooled httpx.AsyncClient serves every request; a semaphore caps concurrent
+    generations and `keep_alive` is sent with each request so the model stays loaded.
+    The client lives on one event loop: the API's loop once `start()` has been
+    awaited there, otherwise a private background loop. Threads that are not on
+    that loop (ingest jobs, the threadpool) use the blocking `generate_sync`.
+    """
+
+    def __init__(self, base_url: str = OLLAMA_SERVICE_URL, model: str = LLM_MODEL,
+                 keep_alive: str = OLLAMA_KEEP_ALIVE, concurrency: int = OLLAMA_CONCURRENCY,
+                 max_retries: int = OLLAMA_MAX_RETRIES, connect_timeout: float = OLLAMA_CONNECT_TIMEOUT,
+                 read_timeout: float = OLLAMA_READ_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.keep_alive = keep_alive
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self._client = None
+        self._slots = None
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def _bind(self, loop):
+        self._loop = loop
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+        )
+        self._slots = asyncio.Semaphore(self.concurrency)
+
+    async def start(self):
+        """Bind the client to the running event loop (call once from the app's lifespan)."""
+        with self._lock:
+            if self._loop is None:
+                self._bind(asyncio.get_running_loop())
+
+    def _sync_loop(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="ollama-client", daemon=True).start()
+                self._bind(loop)
+            return self._loop
+
+    def _payload(self, prompt: str, stream: bool) -> dict:
+        return {"model": self.model, "prompt": prompt, "stream": stream, "keep_alive": self.keep_alive}
+
+    async def _retry_wait(self, attempt: int, reason):
+        backoff = 0.5 * (2 ** attempt)
+        print(f"Ollama request failed ({reason}); retrying in {backoff:.1f}s")
+        await asyncio.sleep(backoff)
+
+    async def generate(self, prompt: str, timeout: float = None) -> str:
+        """Full completion for `prompt`; `timeout` bounds the whole request in seconds."""
+        async with self._slots:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    response = await self._client.post("/api/generate", json=self._payload(prompt, False),
+                                                       timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT)
+                except (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError) as e:
+                    if attempt >= self.max_retries:
+                        raise OllamaError(f"LLM request failed after {attempt + 1} attempts: {e}") from e
+                    await self._retry_wait(attempt, e)
+                    continue
+                except httpx.TimeoutException as e:
+                    raise OllamaError(f"LLM request timed out: {e}") from e
+                if response.status_code in RETRY_STATUS and attempt < self.max_retries:
+                    await self._retry_wait(attempt, f"HTTP {response.status_code}")
+                    continue
+                if response.is_error:
+                    raise OllamaError(f"LLM API error: {response.text}")
+                try:
+                    data = response.json()
+                except json.JSONDecodeError:
+                    raise OllamaError("Invalid JSON response from LLM API")
+                if "response" not in data:
+                    raise OllamaError(f"Unexpected LLM response format: {data}")
+                return data["response"]
+
+    async def stream(self, prompt: str):
+        """Yield completion tokens as Ollama produces them.
+
+        Failures before the first token are retried; after that they are raised.
+        """
+        async with self._slots:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    async with self._client.stream("POST", "/api/generate", json=self._payload(prompt, True)) as response:
+                        if response.status_code in RETRY_STATUS and attempt < self.max_retries:
+                            await response.aread()
+                            await self._retry_wait(attempt, f"HTTP {response.status_code}")
+                            continue
+                        if response.is_error:
+                            await response.aread()
+                            raise OllamaError(f"LLM API error: {response.text}")
+                        async for line in response.aiter_lines():
+                            if not line:
+                                continue
+                            data = json.loads(line)
+                            if data.get("error"):
+                                raise OllamaError(f"LLM API error: {data['error']}")
+                            if data.get("response"):
+                                yield data["response"]
+                            if data.get("done"):
+                                return
+                        return
+                except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                    # Nothing has been yielded yet when the connection itself fails
+                    if attempt >= self.max_retries:
+                        raise OllamaError(f"LLM request failed after {attempt + 1} attempts: {e}") from e
+                    await self._retry_wait(attempt, e)
+                except httpx.TimeoutException as e:
+                    raise OllamaError(f"LLM request timed out: {e}") from e
+
+    async def preload(self):
+        """Load the model into Ollama now (an empty prompt only loads it) so the first request is not slowed."""
+        try:
+            response = await self._client.post("/api/generate", json={"model": self.model, "keep_alive": self.keep_alive})
+            response.raise_for_status()
+            print(f"LLM '{self.model}' loaded in Ollama (keep_alive={self.keep_alive}).")
+        except Exception as e:
+            print(f"Could not preload LLM '{self.model}': {str(e)}")
+
+    def generate_sync(self, prompt: str, timeout: float = None) -> str:
+        """Blocking generate() for threads other than the client's event loop thread.
+
+        `timeout` defaults to OLLAMA_SYNC_TIMEOUT, so a caller is never stuck on a
+        loop that has stopped serving requests.
+        """
+        if timeout is None:
+            timeout = OLLAMA_SYNC_TIMEOUT
+        loop = self._sync_loop()
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            raise RuntimeError("generate_sync would block the event loop; await generate() instead.")
+        future = asyncio.run_coroutine_threadsafe(self.generate(prompt, timeout), loop)
+        try:
+            # The timeout also covers waiting for a free slot
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError as e:
+            future.cancel()
+            raise OllamaError(f"LLM request timed out after {timeout}s") from e
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+
+
+_ollama_client = None
+_ollama_client_lock = threading.Lock()
+
+
+def get_ollama_client() -> OllamaClient:
+    global _ollama_client
+    with _ollama_client_lock:
+        if _ollama_client is None:
+            _ollama_client = OllamaClient()
+        return _ollama_client
@@ -0,0 +1,85 @@
+# === pdf_module ===
+from collections import deque
+from pypdf import PdfReader
+import os
+
+# Pages extracted per worker task
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+# Pages with less embedded text than this are rasterized and OCR'd (hybrid mode)
+PDF_MIN_TEXT_CHARS = int(os.getenv("PDF_MIN_TEXT_CHARS", "1"))
+# Rasterization resolution for OCR'd pages
+PDF_OCR_DPI = int(os.getenv("PDF_OCR_DPI", "200"))
+# "hybrid" OCRs text-less pages; "text" only uses the PDF's embedded text
+PDF_OCR_MODE = os.getenv("PDF_OCR_MODE", "hybrid").lower()
+
+
+def count_pages(pdf_path: str) -> int:
+    return len(PdfReader(pdf_path).pages)
+
+
+def extract_page_range(pdf_path: str, start: int, end: int):
+    """Return [(page_index, text)] for pages start..end-1; runs in an ingest worker process."""
+    reader = PdfReader(pdf_path)
+    return [(page_num, reader.pages[page_num].extract_text() or "") for page_num in range(start, end)]
+
+
+def ocr_pdf_page(pdf_path: str, page_num: int, dpi: int = PDF_OCR_DPI) -> str:
+    """Rasterize one page and run it through preprocessing + OCR; runs in an ingest worker process.
+
+    The worker's resident OCR engine is reused across pages.
+    """
+    import cv2
+    import fitz
+    import numpy as np
+    from services.ocr_module import extract_text
+    from services.preprocess import light_preprocess_image
+
+    with fitz.open(pdf_path) as document:
+        pixmap = document[page_num].get_pixmap(dpi=dpi)
+    image = np.frombuffer(pixmap.samples, dtype=np.uint8).reshape(pixmap.height, pixmap.width, pixmap.n)
+    if pixmap.n == 4:
+        image = cv2.cvtColor(image, cv2.COLOR_RGBA2BGR)
+    elif pixmap.n == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+    else:
+        image = image[:, :, 0]
+    text = extract_text(light_preprocess_image(image))
+    return "" if text == "No text detected" else text
+
+
+def iter_pdf_pages(pdf_path: str, submit_cpu, num_pages: int, max_inflight: int = 2, ocr_fallback: bool = False):
+    """Yield (page_index, text, ocr_used) in page order while later pages are still being processed.
+
+    `submit_cpu(fn, *args)` must return a future. At most `max_inflight` page ranges and
+    `max_inflight` OCR pages are queued at once so one large PDF cannot monopolize the
+    worker pool. With `ocr_fallback`, pages without embedded text are rasterized and OCR'd;
+    pages that do have text are never rasterized.
+    """
+    max_inflight = max(1, max_inflight)
+    ranges = deque((start, min(start + PDF_PAGES_PER_TASK, num_pages))
+                   for start in range(0, num_pages, PDF_PAGES_PER_TASK))
+    inflight = deque()
+    ordered = deque()  # (page_index, text, OCR future or None), in page order
+
+    while ranges or inflight:
+        while ranges and len(inflight) < max_inflight:
+            start, end = ranges.popleft()
+            inflight.append(submit_cpu(extract_page_range, pdf_path, start, end))
+        for page_num, text in inflight.popleft().result():
+            if ocr_fallback and len(text.strip()) < PDF_MIN_TEXT_CHARS:
+                ordered.append((page_num, None, submit_cpu(ocr_pdf_page, pdf_path, page_num)))
+            else:
+                ordered.append((page_num, text, None))
+
+        # Emit the ready prefix; wait on the oldest OCR page only when too many are queued
+        while ordered:
+            page_num, text, future = ordered[0]
+            if future is not None and not future.done():
+                if sum(1 for entry in ordered if entry[2] is not None) <= max_inflight:
+                    break
+            ordered.popleft()
+            yield (page_num, future.result(), True) if future is not None else (page_num, text, False)
+
+    while ordered:
+        page_num, text, future = ordered.popleft()
+        yield (page_num, future.result(), True) if future is not None else (page_num, text, False)
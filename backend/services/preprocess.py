@@ -3,24 +3,89 @@ import cv2
 import numpy as np
 import os
 import threading
+import uuid
 
+# Write every preprocessed image to this directory for inspection (disabled when unset)
+PREPROCESS_DEBUG_DIR = os.getenv("PREPROCESS_DEBUG_DIR", "")
+# Default speed/accuracy trade-off for light preprocessing: fast, balanced or quality
+PREPROCESS_PROFILE = os.getenv("PREPROCESS_PROFILE", "balanced")
 
-def preprocess_image(image_path: str) -> str:
-    image = cv2.imread(image_path)
+# max_side: longest edge after downscaling (None keeps full resolution).
+# Noise is estimated per image; below low_noise no denoising is done, below
+# high_noise a median filter is used, above it non-local means.
+PROFILES = {
+    "fast": {"max_side": 1280, "low_noise": 4.0, "high_noise": None, "nlm": None},
+    "balanced": {"max_side": 2000, "low_noise": 3.0, "high_noise": 8.0,
+                 "nlm": {"h": 10, "templateWindowSize": 7, "searchWindowSize": 11}},
+    "quality": {"max_side": None, "low_noise": 0.0, "high_noise": 0.0,
+                "nlm": {"h": 20, "templateWindowSize": 8, "searchWindowSize": 21}},
+}
+
+# Built once instead of on every call
+GAMMA = 1.5
+GAMMA_TABLE = np.array([((i / 255.0) ** (1.0 / GAMMA)) * 255 for i in range(256)]).astype(np.uint8)
+KERNEL = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+KERNEL_SMALL = cv2.getStructuringElement(cv2.MORPH_RECT, (2, 2))
+# Immerkaer's noise-estimation mask
+NOISE_KERNEL = np.array([[1, -2, 1], [-2, 4, -2], [1, -2, 1]], dtype=np.float32)
+
+
+def decode_image(content: bytes) -> np.ndarray:
+    image = cv2.imdecode(np.frombuffer(content, dtype=np.uint8), cv2.IMREAD_COLOR)
     if image is None:
-        raise FileNotFoundError(f"Image not found or cannot be opened: {image_path}")
-    
+        raise ValueError("Image could not be decoded.")
+    return image
+
+
+def save_debug_image(image: np.ndarray, name: str = "image"):
+    """Write `image` to PREPROCESS_DEBUG_DIR and return the path, or None when debugging is off."""
+    if not PREPROCESS_DEBUG_DIR:
+        return None
+    os.makedirs(PREPROCESS_DEBUG_DIR, exist_ok=True)
+    base = os.path.splitext(os.path.basename(name))[0] or "image"
+    out_path = os.path.join(PREPROCESS_DEBUG_DIR, f"{base}_{uuid.uuid4().hex[:8]}_preprocessed.jpg")
+    success = cv2.imwrite(out_path, image)
+    if not success:
+        raise IOError(f"Failed to write preprocessed image to: {out_path}")
+    return out_path
+
+
+def downscale(image: np.ndarray, max_side) -> np.ndarray:
+    """Shrink so the longest edge is at most `max_side`; OCR gains nothing from more pixels."""
+    height, width = image.shape[:2]
+    if not max_side or max(height, width) <= max_side:
+        return image
+    scale = max_side / max(height, width)
+    return cv2.resize(image, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+
+
+def estimate_noise(gray: np.ndarray) -> float:
+    """Fast estimate of the Gaussian noise sigma of a grayscale image (Immerkaer, 1996)."""
+    height, width = gray.shape[:2]
+    if height < 3 or width < 3:
+        return 0.0
+    response = cv2.filter2D(gray.astype(np.float32), -1, NOISE_KERNEL)[1:-1, 1:-1]
+    return float(np.abs(response).sum() * np.sqrt(0.5 * np.pi) / (6.0 * (width - 2) * (height - 2)))
+
+
+def denoise(gray: np.ndarray, settings: dict) -> np.ndarray:
+    sigma = estimate_noise(gray)
+    if sigma < settings["low_noise"]:
+        return gray
+    if settings["nlm"] is None or (settings["high_noise"] is not None and sigma < settings["high_noise"]):
+        return cv2.medianBlur(gray, 3)
+    return cv2.fastNlMeansDenoising(gray, None, **settings["nlm"])
+
+
+def preprocess_image(image: np.ndarray) -> np.ndarray:
     # Grayscale
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
     # Denoise
     denoised = cv2.fastNlMeansDenoising(gray, None, h=20, templateWindowSize=8, searchWindowSize=21)
     # Blur
     blurred = cv2.GaussianBlur(denoised, (7, 7), 0)
     # Gamma correction
-    gamma = 1.5
-    inv_gamma = 1.0 / gamma
-    table = np.array([((i / 255.0) ** inv_gamma) * 255 for i in range(256)]).astype(np.uint8)
-    gamma_corrected = cv2.LUT(blurred, table)
+    gamma_corrected = cv2.LUT(blurred, GAMMA_TABLE)
     # Adaptive threshold
     thresh = cv2.adaptiveThreshold(
         gamma_corrected, 255,
@@ -28,41 +93,16 @@ def preprocess_image(image_path: str) -> str:
         cv2.THRESH_BINARY_INV, 19, 19
     )
     # Morphological operations
-    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
-    kernel_small = cv2.getStructuringElement(cv2.MORPH_RECT, (2, 2))
-    close_morph = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel, iterations=1)
-    dilation = cv2.dilate(close_morph, kernel_small, iterations=2)
-
-    # Save processed
-    base, ext = os.path.splitext(image_path)
-    out_path = f"{base}_preprocessed.jpg" 
-    success = cv2.imwrite(out_path, dilation)
-    if not success:
-        raise IOError(f"Failed to write preprocessed image to: {out_path}")
-    return out_path
+    close_morph = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, KERNEL, iterations=1)
+    return cv2.dilate(close_morph, KERNEL_SMALL, iterations=2)
 
-def light_preprocess_image(image_path: str) -> str:
-    image = cv2.imread(image_path)
-    if image is None:
-        raise FileNotFoundError(f"Image not found or cannot be opened: {image_path}")
-    
+def light_preprocess_image(image: np.ndarray, profile: str = None) -> np.ndarray:
+    settings = PROFILES[profile or PREPROCESS_PROFILE]
+    # Downscale oversized photos before any per-pixel work
+    image = downscale(image, settings["max_side"])
     # Grayscale
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    # Denoise
-    denoised = cv2.fastNlMeansDenoising(gray, None, h=20, templateWindowSize=8, searchWindowSize=21)
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    # Denoise, as strongly as the estimated noise level calls for
+    denoised = denoise(gray, settings)
     # Gamma correction
-    gamma = 1.5
-    inv_gamma = 1.0 / gamma
-    table = np.array([((i / 255.0) ** inv_gamma) * 255 for i in range(256)]).astype(np.uint8)
-    gamma_corrected = cv2.LUT(denoised, table)
-    
-    # Save processed
-    base, ext = os.path.splitext(image_path)
-    out_path = f"{base}_preprocessed.jpg" 
-    success = cv2.imwrite(out_path, gamma_corrected)
-    if not success:
-        raise IOError(f"Failed to write preprocessed image to: {out_path}")
-    return out_path
-
-
-
+    return cv2.LUT(denoised, GAMMA_TABLE)
@@ -0,0 +1,151 @@
+# === reranker ===
+from collections import OrderedDict
+from services.llm_module import query_llm
+from services.response_cache import normalize_query
+import os
+import re
+import threading
+import time
+
+# Reranking stage for /chat: none, cross-encoder, llm, or auto (cross-encoder if
+# sentence-transformers is installed, otherwise none: on CPU a listwise LLM call rarely
+# fits RERANK_BUDGET_MS, so `llm` has to be chosen explicitly with a larger budget)
+RERANKER = os.getenv("RERANKER", "none")
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# Candidates retrieved for reranking; only the best few of them go into the prompt
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "12"))
+# Per-request time budget; when it runs out the retrieval order is used instead
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "800"))
+# (query, chunk) pairs scored per cross-encoder forward pass
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "8"))
+# Cached (query, chunk) scores
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "20000"))
+# Characters of each chunk shown to the LLM reranker
+_LLM_PASSAGE_CHARS = 500
+
+
+class Reranker:
+    """Reorder retrieved chunks by relevance to the query within a time budget.
+
+    Scores are cached per (model, normalized query, chunk id), so repeated and
+    follow-up questions only score chunks they have not seen. If the budget runs
+    out before every candidate is scored, the retrieval order is returned unchanged.
+    """
+
+    def __init__(self, kind: str = RERANKER, model_name: str = RERANK_MODEL, budget_ms: float = RERANK_BUDGET_MS,
+                 batch_size: int = RERANK_BATCH_SIZE, cache_size: int = RERANK_CACHE_SIZE):
+        if kind == "auto":
+            try:
+                import sentence_transformers  # noqa: F401
+                kind = "cross-encoder"
+            except ImportError:
+                print("RERANKER=auto: sentence-transformers is not installed; reranking is disabled.")
+                kind = "none"
+        if kind not in ("none", "cross-encoder", "llm"):
+            raise ValueError(f"Unknown RERANKER '{kind}'. Use none, cross-encoder, llm or auto.")
+        self.kind = kind
+        self.model_name = model_name if kind == "cross-encoder" else kind
+        self.budget = budget_ms / 1000
+        self.batch_size = max(1, batch_size)
+        self.cache_size = cache_size
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "fallbacks": 0, "cache_hits": 0, "scored": 0, "seconds": 0.0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.kind != "none"
+
+    def load(self):
+        """Load the cross-encoder now so the first request's budget is not spent on it."""
+        if self.kind != "cross-encoder":
+            return
+        with self._model_lock:
+            if self._model is None:
+                from sentence_transformers import CrossEncoder
+                start = time.perf_counter()
+                self._model = CrossEncoder(self.model_name, device="cpu")
+                print(f"Reranker '{self.model_name}' loaded in {time.perf_counter() - start:.2f}s")
+
+    def rerank(self, query: str, docs, k: int):
+        """Best `k` of `docs` (Documents with chunk ids), or the first `k` if over budget."""
+        if not self.enabled or len(docs) <= 1:
+            return docs[:k]
+        start = time.perf_counter()
+        deadline = start + self.budget
+        key_query = normalize_query(query)
+        with self._lock:
+            scores = {}
+            for doc in docs:
+                key = (self.model_name, key_query, doc.id)
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    scores[doc.id] = self._cache[key]
+            self._stats["requests"] += 1
+            self._stats["cache_hits"] += len(scores)
+        missing = [doc for doc in docs if doc.id not in scores]
+
+        try:
+            fresh = self._score(query, missing, deadline) if missing else {}
+        except Exception as e:
+            print(f"Reranking failed, keeping retrieval order: {str(e)}")
+            fresh = None
+        with self._lock:
+            for chunk_id, score in (fresh or {}).items():
+                self._cache[(self.model_name, key_query, chunk_id)] = score
+                self._cache.move_to_end((self.model_name, key_query, chunk_id))
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            self._stats["scored"] += len(fresh or {})
+            self._stats["seconds"] += time.perf_counter() - start
+            if fresh is None or len(fresh) < len(missing):
+                self._stats["fallbacks"] += 1
+                return docs[:k]
+        scores.update(fresh)
+        # Stable sort: ties keep their retrieval order
+        return sorted(docs, key=lambda doc: scores[doc.id], reverse=True)[:k]
+
+    def _score(self, query: str, docs, deadline: float) -> dict:
+        """{chunk id: score} for as many of `docs` as fit before `deadline`."""
+        if self.kind == "cross-encoder":
+            self.load()
+            scores = {}
+            for start in range(0, len(docs), self.batch_size):
+                if time.perf_counter() >= deadline:
+                    break
+                batch = docs[start:start + self.batch_size]
+                values = self._model.predict([(query, doc.page_content) for doc in batch],
+                                             batch_size=self.batch_size, show_progress_bar=False)
+                scores.update({doc.id: float(value) for doc, value in zip(batch, values)})
+            return scores
+        return self._score_with_llm(query, docs, deadline)
+
+    def _score_with_llm(self, query: str, docs, deadline: float) -> dict:
+        # One listwise prompt for all candidates; a prompt per chunk would never fit the budget
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            return {}
+        passages = "\n\n".join(f"[{n}] {doc.page_content[:_LLM_PASSAGE_CHARS]}" for n, doc in enumerate(docs, start=1))
+        prompt = (f"Rank the following passages by how useful they are for answering the question.\n"
+                  f"Question: {query}\n\n{passages}\n\n"
+                  f"Answer only with the passage numbers, most relevant first, separated by commas.")
+        answer = query_llm(prompt, timeout=remaining)
+        ranking = []
+        for number in re.findall(r"\d+", answer):
+            n = int(number)
+            if 1 <= n <= len(docs) and n not in ranking:
+                ranking.append(n)
+        # Passages the model left out rank below every listed one
+        scores = {doc.id: 0.0 for doc in docs}
+        for position, n in enumerate(ranking):
+            scores[docs[n - 1].id] = float(len(docs) - position)
+        return scores
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["kind"] = self.kind
+        stats["avg_ms"] = stats.pop("seconds") * 1000 / stats["requests"] if stats["requests"] else 0.0
+        return stats
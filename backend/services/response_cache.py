@@ -0,0 +1,107 @@
+# === response_cache ===
+from collections import OrderedDict
+import numpy as np
+import os
+import threading
+import time
+
+# Cached chat answers kept (least recently used are evicted first)
+CHAT_CACHE_SIZE = int(os.getenv("CHAT_CACHE_SIZE", "512"))
+# Seconds a cached answer stays valid
+CHAT_CACHE_TTL = float(os.getenv("CHAT_CACHE_TTL", "3600"))
+# Cosine similarity at which a differently worded query reuses an answer (0 disables)
+CHAT_CACHE_SIMILARITY = float(os.getenv("CHAT_CACHE_SIMILARITY", "0.95"))
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split()).rstrip("?!.。？！ ")
+
+
+def _unit(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class ResponseCache:
+    """LRU/TTL cache of chat answers keyed by normalized query + retrieved chunk ids.
+
+    Because the retrieved chunk ids are part of the key, an answer is only reused when
+    the index returns the same context, so new ingests invalidate entries naturally.
+    A query that differs in wording can still hit when its embedding is within
+    `similarity` of a cached query that retrieved the same chunks.
+    """
+
+    def __init__(self, size: int = CHAT_CACHE_SIZE, ttl: float = CHAT_CACHE_TTL,
+                 similarity: float = CHAT_CACHE_SIMILARITY):
+        self.size = size
+        self.ttl = ttl
+        self.similarity = similarity
+        self._entries = OrderedDict()  # (query, chunk ids) -> (answer, unit query vector, expires at)
+        self._by_chunks = {}           # chunk ids -> set of keys, for semantic lookups
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        keys = self._by_chunks.get(key[1])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_chunks[key[1]]
+
+    def get(self, query: str, chunk_ids, query_vector):
+        key = (normalize_query(query), tuple(chunk_ids))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] > now:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry[0]
+            if entry is not None:
+                self._remove(key)
+
+            if self.similarity > 0:
+                vector = _unit(query_vector)
+                best_key, best_score = None, self.similarity
+                for candidate in list(self._by_chunks.get(key[1], ())):
+                    answer, candidate_vector, expires_at = self._entries[candidate]
+                    if expires_at <= now:
+                        self._remove(candidate)
+                        continue
+                    score = float(np.dot(vector, candidate_vector))
+                    if score >= best_score:
+                        best_key, best_score = candidate, score
+                if best_key is not None:
+                    self._entries.move_to_end(best_key)
+                    self.semantic_hits += 1
+                    return self._entries[best_key][0]
+
+            self.misses += 1
+            return None
+
+    def put(self, query: str, chunk_ids, query_vector, answer: str):
+        if self.size <= 0:
+            return
+        key = (normalize_query(query), tuple(chunk_ids))
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (answer, _unit(query_vector), time.monotonic() + self.ttl)
+            self._by_chunks.setdefault(key[1], set()).add(key)
+            while len(self._entries) > self.size:
+                self._remove(next(iter(self._entries)))
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            total = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": hits / total if total else 0.0,
+            }
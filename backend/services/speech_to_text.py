@@ -1,48 +1,155 @@
 import whisper
+import numpy as np
 import os # Added import
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.vectorstores import FAISS
-from langchain.embeddings import OllamaEmbeddings
+import threading
+import time
+from collections import deque
+import torch
 # from langchain.llms import Ollama
 
-# Define a persistent path for the FAISS index
-FAISS_INDEX_PATH = "services/faiss_index"
+from services.chunking import split_into_chunks
+from services.vector_store import DEFAULT_COLLECTION, get_vector_store
 
+# Whisper model size for this deployment: tiny, base, small or medium
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "medium")
+# Number of CPU threads torch may use for inference (0 keeps torch's default)
+WHISPER_THREADS = int(os.getenv("WHISPER_THREADS", "0"))
+# Use dynamically quantized int8 linear layers on CPU
+WHISPER_INT8 = os.getenv("WHISPER_INT8", "false").lower() in ("1", "true", "yes")
+# Load the Whisper model at startup instead of on the first audio upload
+WHISPER_PRELOAD = os.getenv("WHISPER_PRELOAD", "false").lower() in ("1", "true", "yes")
+# Target length of the audio windows transcribed in parallel (0 transcribes the file in one call)
+WHISPER_WINDOW_SECONDS = float(os.getenv("WHISPER_WINDOW_SECONDS", "60"))
+# How far before each window boundary to look for a quiet point to cut at
+WHISPER_SPLIT_SEARCH_SECONDS = float(os.getenv("WHISPER_SPLIT_SEARCH_SECONDS", "5"))
 
+SAMPLE_RATE = whisper.audio.SAMPLE_RATE
+# Frame length used when looking for silence
+_ENERGY_FRAME = SAMPLE_RATE // 10
 
-def transcribe_audio(audio_path):
-    
-    model=whisper.load_model("medium")
+_whisper_model = None
+_whisper_lock = threading.Lock()
 
-    # Transcribe the audio file
-    result = model.transcribe(audio_path)
-    print(f'Transcribed Text:\n{result["text"]}')
-    return result["text"]
-    
-def embed_transcription(transcription):
-    
-    # Initialize the Ollama embeddings model
-    embeddings = OllamaEmbeddings(model="nomic-embed-text")
+
+
+def _quantize_int8(model):
+    """Replace the model's linear layers with dynamically quantized int8 ones.
+
+    quantize_dynamic matches modules by exact type, and whisper builds its layers from
+    its own whisper.model.Linear subclass, which it would skip. That subclass only adds
+    a cast of the weights to the input dtype, a no-op for fp32 CPU inference, so those
+    layers are turned back into plain nn.Linear before converting.
+    """
+    for module in model.modules():
+        if isinstance(module, torch.nn.Linear) and type(module) is not torch.nn.Linear:
+            module.__class__ = torch.nn.Linear
+    model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    quantized = sum(isinstance(module, torch.ao.nn.quantized.dynamic.Linear) for module in model.modules())
+    if not quantized:
+        raise RuntimeError("WHISPER_INT8 is set but no Whisper linear layer was quantized.")
+    print(f"Quantized {quantized} Whisper linear layers to int8.")
+    return model
+
+
+def get_whisper_model():
+    """Return the process-wide Whisper model, loading it on first use."""
+    global _whisper_model
+    if _whisper_model is not None:
+        return _whisper_model
+    with _whisper_lock:
+        if _whisper_model is None:
+            if WHISPER_THREADS > 0:
+                torch.set_num_threads(WHISPER_THREADS)
+            start = time.perf_counter()
+            model = whisper.load_model(WHISPER_MODEL, device="cpu")
+            if WHISPER_INT8:
+                model = _quantize_int8(model)
+            model.eval()
+            print(f"Whisper model '{WHISPER_MODEL}' loaded in {time.perf_counter() - start:.2f}s (int8={WHISPER_INT8})")
+            _whisper_model = model
+    return _whisper_model
+
+
+def load_audio(audio_path) -> np.ndarray:
+    """Decode any ffmpeg-readable file to 16 kHz mono float32 samples."""
+    return whisper.load_audio(audio_path)
+
+
+def split_audio(samples: np.ndarray, window_seconds: float = WHISPER_WINDOW_SECONDS,
+                search_seconds: float = WHISPER_SPLIT_SEARCH_SECONDS):
+    """Cut `samples` into (start, end) sample ranges of about `window_seconds`.
+
+    Each cut is placed at the quietest 100 ms frame in the `search_seconds` before the
+    window boundary, so words are rarely split between two windows.
+    """
+    total = len(samples)
+    window = int(window_seconds * SAMPLE_RATE)
+    if window <= 0 or total <= window:
+        return [(0, total)]
+    search = min(int(search_seconds * SAMPLE_RATE), window // 2)
+    ranges = []
+    start = 0
+    while total - start > window:
+        boundary = start + window
+        region = samples[boundary - search:boundary]
+        frames = len(region) // _ENERGY_FRAME
+        if frames:
+            energy = np.square(region[:frames * _ENERGY_FRAME]).reshape(frames, _ENERGY_FRAME).mean(axis=1)
+            boundary = boundary - search + int(np.argmin(energy)) * _ENERGY_FRAME + _ENERGY_FRAME // 2
+        ranges.append((start, boundary))
+        start = boundary
+    ranges.append((start, total))
+    return ranges
+
+
+def transcribe_samples(samples: np.ndarray, offset_seconds: float = 0.0):
+    """Transcribe one audio window; runs in an ingest worker process.
+
+    Returns Whisper's segments as [{"start", "end", "text"}] with times in seconds
+    from the start of the whole recording.
+    """
+    model = get_whisper_model()
+    with _whisper_lock:
+        result = model.transcribe(samples, fp16=False)
+    return [
+        {"start": round(offset_seconds + segment["start"], 2),
+         "end": round(offset_seconds + segment["end"], 2),
+         "text": segment["text"].strip()}
+        for segment in result["segments"] if segment["text"].strip()
+    ]
+
+
+def iter_transcription(audio_path, submit_cpu, max_inflight: int = 2):
+    """Yield (window_index, window_count, segments) in order while later windows are still transcribing.
+
+    `submit_cpu(fn, *args)` must return a future; at most `max_inflight` windows are queued at once.
+    """
+    samples = load_audio(audio_path)
+    ranges = deque(split_audio(samples))
+    window_count = len(ranges)
+    print(f"Transcribing {len(samples) / SAMPLE_RATE:.1f}s of audio in {window_count} windows.")
+    inflight = deque()
+    for index in range(window_count):
+        while ranges and len(inflight) < max(1, max_inflight):
+            start, end = ranges.popleft()
+            inflight.append(submit_cpu(transcribe_samples, samples[start:end].copy(), start / SAMPLE_RATE))
+        yield index, window_count, inflight.popleft().result()
+
+
+def embed_transcription(transcription, vector_store=None, file_hash=None, filename=None, info=None, metadata=None,
+                        collection=DEFAULT_COLLECTION):
+
+    vector_store = vector_store or get_vector_store()
 
     # Split the transcription into manageable chunks
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    texts = text_splitter.split_text(transcription)
-
-    if os.path.exists(FAISS_INDEX_PATH):
-        # Load the existing FAISS index
-        vector_store = FAISS.load_local(FAISS_INDEX_PATH, embeddings, allow_dangerous_deserialization=True)
-        # Add new texts to the loaded index
-        vector_store.add_texts(texts)
-        print(f"FAISS index loaded from {FAISS_INDEX_PATH} and updated.")
-    else:
-        # Create a new FAISS index from the texts
-        vector_store = FAISS.from_texts(texts, embeddings)
-        print(f"New FAISS index created at {FAISS_INDEX_PATH}.")
-
-    # Save the (new or updated) index to disk
-    vector_store.save_local(FAISS_INDEX_PATH)
-    print(f"FAISS index saved to {FAISS_INDEX_PATH}.")
+    texts, metadatas = split_into_chunks(transcription, metadata)
 
-    return vector_store
-    
+    # Add the chunks to the in-memory index; it is persisted in the background
+    vector_store.add_texts(texts, metadatas)
+    print(f"Added {len(texts)} chunks to the FAISS index.")
 
+    # Remember the upload so identical bytes are not processed again
+    if file_hash:
+        vector_store.register_document(file_hash, filename, len(texts), info, collection)
+
+    return vector_store
@@ -0,0 +1,660 @@
+# === vector_store ===
+from contextlib import contextmanager
+from langchain_core.documents import Document
+from services.ann_index import (INDEX_TYPES, VECTOR_EXACT_FILTER_MAX, VECTOR_INDEX_MIGRATE_AT, VECTOR_INDEX_TYPE,
+                                 VECTOR_IVF_NLIST, RawVectorFile, build_index, index_kind, max_breadth,
+                                 search_parameters)
+from services.chunk_store import DEFAULT_COLLECTION, ChunkStore
+from services.lexical_index import BM25Index, reciprocal_rank_fusion
+import faiss
+import json
+import numpy as np
+import os
+import shutil
+import threading
+import time
+
+# Define a persistent path for the FAISS index
+FAISS_INDEX_PATH = "services/faiss_index"
+
+# Compact the write-ahead log into a new snapshot at most this many seconds after a write
+COMPACT_INTERVAL = float(os.getenv("VECTOR_STORE_COMPACT_INTERVAL", "300"))
+# Compact immediately once the write-ahead log holds this many chunks
+COMPACT_RECORDS = int(os.getenv("VECTOR_STORE_COMPACT_RECORDS", "5000"))
+# fsync every log append (disable only if losing the last writes on power loss is acceptable)
+WAL_FSYNC = os.getenv("VECTOR_STORE_WAL_FSYNC", "true").lower() in ("1", "true", "yes")
+# Default retrieval: "hybrid" fuses BM25 and vector rankings, "vector" or "lexical" uses one
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+RETRIEVAL_MODES = ("hybrid", "vector", "lexical")
+# Candidates taken from each ranking before fusion
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+
+CURRENT_FILE = "CURRENT"
+INDEX_FILE = "index.faiss"
+CHUNKS_DB = "chunks.db"
+VECTORS_FILE = "vectors.f32"
+LEGACY_DOCSTORE = "index.pkl"
+# Stored vectors whose length is checked on load
+_NORM_CHECK_SAMPLE = 1024
+
+
+def _snapshot_name(generation: int) -> str:
+    return f"snapshot-{generation:06d}"
+
+
+def _wal_name(generation: int) -> str:
+    return f"wal-{generation:06d}.log"
+
+
+def _as_unit_vectors(vectors) -> np.ndarray:
+    """float32 rows scaled to unit length, so L2 ranking equals cosine ranking.
+
+    Ollama's batched /api/embed returns normalized vectors while the older
+    /api/embeddings does not; normalizing everything keeps both comparable.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def normalize_collection(name) -> str:
+    """Collection name to store under; None or blank means the default collection."""
+    if name is None or not str(name).strip():
+        return DEFAULT_COLLECTION
+    name = str(name).strip()
+    if len(name) > 100:
+        raise ValueError("Collection names are limited to 100 characters.")
+    return name
+
+
+def _fsync_dir(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class ReadWriteLock:
+    """Many concurrent readers or one writer; waiting writers block new readers."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class VectorStoreService:
+    """Long-lived in-memory FAISS index persisted as snapshot + append-only log.
+
+    On-disk layout under `index_path`:
+        CURRENT               name of the live snapshot directory
+        snapshot-NNNNNN/      index.faiss written by faiss.write_index
+        wal-NNNNNN.log        JSON lines of (id, vector) added since that snapshot
+        chunks.db             SQLite chunk texts and metadata keyed by vector id
+        vectors.f32           raw float32 vectors of every snapshotted chunk, in id order
+
+    Ingest only appends to the log, so its cost is proportional to the new document.
+    Compaction writes a new snapshot to a temporary directory, renames it into place
+    and then swaps CURRENT atomically, so a crash at any point leaves either the old
+    or the new generation intact. Chunk rows are committed before their vectors are
+    logged, and rows left without a vector by a crash are dropped on load.
+
+    The index starts as exact flat search. Once it holds VECTOR_INDEX_MIGRATE_AT
+    vectors it is rebuilt in the background as VECTOR_INDEX_TYPE (HNSW, IVF-Flat or
+    IVF-PQ) from vectors.f32, and IVF indexes are retrained as the corpus outgrows
+    their cell count; searches keep using the old index until the new one is swapped in.
+
+    Indexes written by LangChain's save_local (index.faiss + pickled index.pkl, either
+    in `index_path` or in a snapshot) are migrated into chunks.db once on load.
+    """
+
+    def __init__(self, index_path: str, embeddings):
+        self.index_path = index_path
+        self.embeddings = embeddings
+        self._index = None
+        self._chunks = None
+        self._lock = ReadWriteLock()
+        self._generation = 0
+        self._wal = None
+        self._wal_records = 0
+        self._needs_snapshot = False
+        self._compact_lock = threading.Lock()
+        # Held by every change to the index, log or pending vectors and for a whole compaction.
+        # Writers wait here while a snapshot is written, so they never queue on the
+        # read-write lock ahead of searches
+        self._snapshot_lock = threading.Lock()
+        self._timer = None
+        self._stats_lock = threading.Lock()
+        self._duplicate_uploads = 0
+        self._new_uploads = 0
+        # collection -> (faiss.IDSelectorBatch over its vector ids, set of those ids), dropped when the collection grows
+        self._selectors = {}
+        self._collection_versions = {}
+        self._lexical = BM25Index()
+        # Set once the BM25 index covers chunks.db; until then searches are vector-only
+        self._lexical_ready = threading.Event()
+        self._raw = None
+        # Vectors added since the last snapshot, not yet in vectors.f32
+        self._pending_vectors = []
+        self._migrating = False
+
+    def load(self):
+        os.makedirs(self.index_path, exist_ok=True)
+        start = time.perf_counter()
+        self._chunks = ChunkStore(os.path.join(self.index_path, CHUNKS_DB))
+        current_path = os.path.join(self.index_path, CURRENT_FILE)
+        snapshot_path = None
+        if os.path.exists(current_path):
+            with open(current_path, encoding="utf-8") as f:
+                snapshot = f.read().strip()
+            self._generation = int(snapshot.rsplit("-", 1)[-1])
+            snapshot_path = os.path.join(self.index_path, snapshot)
+        elif os.path.exists(os.path.join(self.index_path, INDEX_FILE)):
+            snapshot_path = self.index_path
+        index = None
+        if snapshot_path is not None:
+            index = faiss.read_index(os.path.join(snapshot_path, INDEX_FILE))
+            index = self._normalize_flat_index(index)
+            if os.path.exists(os.path.join(snapshot_path, LEGACY_DOCSTORE)):
+                self._migrate_docstore(os.path.join(snapshot_path, LEGACY_DOCSTORE), index.ntotal)
+        self._raw = RawVectorFile(os.path.join(self.index_path, VECTORS_FILE))
+        self._sync_raw_vectors(index)
+        self._remove_stale_files()
+
+        index = self._replay_wal(index)
+        ntotal = index.ntotal if index is not None else 0
+        orphans = self._chunks.delete_from(ntotal)
+        if orphans:
+            print(f"Dropped {orphans} chunk rows whose vectors were never logged.")
+        with self._lock.write():
+            self._index = index
+        # Tokenizing every stored chunk takes a while on a large corpus; do not hold up startup
+        threading.Thread(target=self._build_lexical_index, name="bm25-build", daemon=True).start()
+        self._wal = open(self._wal_path(self._generation), "a", encoding="utf-8")
+        print(f"FAISS index loaded from {self.index_path} in {time.perf_counter() - start:.2f}s "
+              f"(generation {self._generation}, {ntotal} vectors, {self._wal_records} from log, "
+              f"{index_kind(index) if index is not None else 'empty'} index)")
+        if self._wal_records or self._needs_snapshot:
+            self._schedule_compaction(delay=0.0 if self._needs_snapshot else None)
+        elif self._migration_due():
+            threading.Thread(target=self._maybe_migrate, name="vector-index-migration", daemon=True).start()
+
+    def _sync_raw_vectors(self, index):
+        """Make vectors.f32 hold exactly the snapshot's vectors.
+
+        Rows appended by a compaction that crashed before publishing its snapshot are
+        cut off (the log replays them); a missing file is rebuilt from a flat index.
+        """
+        if index is None:
+            if os.path.exists(self._raw.path):
+                os.remove(self._raw.path)
+            return
+        rows = self._raw.rows(index.d)
+        if rows > index.ntotal:
+            self._raw.truncate(index.d, index.ntotal)
+        elif rows < index.ntotal:
+            if index_kind(index) != "flat":
+                print(f"{VECTORS_FILE} is missing {index.ntotal - rows} vectors of the {index_kind(index)} index; "
+                      f"it cannot be rebuilt as another index type.")
+                return
+            for start in range(rows, index.ntotal, 65536):
+                self._raw.append(index.reconstruct_n(start, min(65536, index.ntotal - start)))
+
+    def _build_lexical_index(self):
+        # Chunks added meanwhile are indexed by add_texts; BM25Index.add skips ids it already has
+        start = time.perf_counter()
+        try:
+            batch_ids, batch_texts = [], []
+            for chunk_id, text in self._chunks.iter_texts():
+                batch_ids.append(chunk_id)
+                batch_texts.append(text)
+                if len(batch_ids) >= 5000:
+                    self._lexical.add(batch_ids, batch_texts)
+                    batch_ids, batch_texts = [], []
+            self._lexical.add(batch_ids, batch_texts)
+        except Exception as e:
+            print(f"Building the BM25 index failed; retrieval stays vector-only: {str(e)}")
+            return
+        self._lexical_ready.set()
+        print(f"BM25 index built over {len(self._lexical)} chunks in {time.perf_counter() - start:.2f}s.")
+
+    def _migrate_docstore(self, pkl_path: str, ntotal: int):
+        """One-time import of a LangChain pickled docstore into chunks.db."""
+        if self._chunks.count() >= ntotal:
+            self._needs_snapshot = True
+            return
+        import pickle
+        print(f"Migrating legacy docstore {pkl_path} into {CHUNKS_DB}...")
+        with open(pkl_path, "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        ids, texts, metadatas = [], [], []
+        for position in range(ntotal):
+            doc = docstore.search(index_to_docstore_id[position])
+            if isinstance(doc, str):
+                continue
+            ids.append(position)
+            texts.append(doc.page_content)
+            metadatas.append(doc.metadata)
+        self._chunks.add(ids, texts, metadatas)
+        self._needs_snapshot = True
+        # The legacy files are left in place (they may be tracked); once CURRENT exists they are not read
+        print(f"Migrated {len(ids)} chunks; the next snapshot replaces the legacy index.")
+
+    def _normalize_flat_index(self, index):
+        """Rescale vectors written before embeddings were normalized.
+
+        Only an evenly spread sample is checked: unnormalized vectors come from indexes
+        written before normalization, and those are rewritten in full the first time.
+        """
+        if not isinstance(index, faiss.IndexFlat) or index.ntotal == 0:
+            return index
+        sample = np.unique(np.linspace(0, index.ntotal - 1, min(index.ntotal, _NORM_CHECK_SAMPLE)).astype(np.int64))
+        if np.allclose(np.linalg.norm(index.reconstruct_batch(sample), axis=1), 1.0, atol=1e-3):
+            return index
+        vectors = index.reconstruct_n(0, index.ntotal)
+        print(f"Normalizing {index.ntotal} stored vectors to unit length...")
+        normalized = faiss.IndexFlatL2(index.d)
+        normalized.add(_as_unit_vectors(vectors))
+        self._needs_snapshot = True
+        return normalized
+
+    def _wal_path(self, generation: int) -> str:
+        return os.path.join(self.index_path, _wal_name(generation))
+
+    def _replay_wal(self, index):
+        path = self._wal_path(self._generation)
+        self._wal_records = 0
+        if not os.path.exists(path):
+            return index
+        records = []
+        good_offset = 0
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # A torn final append from a crash; everything before it is valid
+                    break
+                good_offset += len(line)
+        if good_offset < os.path.getsize(path):
+            print(f"Truncating incomplete write-ahead log tail in {path}")
+            with open(path, "r+b") as f:
+                f.truncate(good_offset)
+        if records:
+            vectors = _as_unit_vectors([r["vector"] for r in records])
+            if index is None:
+                index = faiss.IndexFlatL2(vectors.shape[1])
+            index.add(vectors)
+            self._pending_vectors.append(vectors)
+        self._wal_records = len(records)
+        return index
+
+    def _remove_stale_files(self):
+        keep = {_snapshot_name(self._generation), _wal_name(self._generation), CURRENT_FILE,
+                INDEX_FILE, LEGACY_DOCSTORE}
+        for name in os.listdir(self.index_path):
+            if name in keep or not (name.startswith("snapshot-") or name.startswith("wal-") or name.endswith(".tmp")):
+                continue
+            path = os.path.join(self.index_path, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+
+    def is_empty(self) -> bool:
+        with self._lock.read():
+            return self._index is None or self._index.ntotal == 0
+
+    def _selector(self, collection: str = None, document_ids=None):
+        """(faiss ID selector, set of allowed ids) for a collection and/or documents; (None, None) means no filter."""
+        if collection is None and document_ids is None:
+            return None, None
+        if document_ids is None:
+            with self._stats_lock:
+                cached = self._selectors.get(collection)
+                version = self._collection_versions.get(collection, 0)
+            if cached is not None:
+                return cached
+        ids = np.asarray(self._chunks.ids_for(collection, document_ids), dtype=np.int64)
+        selector = (faiss.IDSelectorBatch(len(ids), faiss.swig_ptr(ids)), set(ids.tolist()))
+        # Only cache if no chunks were added to the collection while the ids were read
+        if document_ids is None:
+            with self._stats_lock:
+                if self._collection_versions.get(collection, 0) == version:
+                    self._selectors[collection] = selector
+        return selector
+
+    def _vector_hits(self, query_vector, k: int, selection):
+        """Ids of the top-k vectors, restricted to the selection's ids if it has any.
+
+        The filter is applied inside the FAISS search rather than by discarding results.
+
+        On an approximate index a small selection is scored exactly from the raw vectors;
+        a larger one is searched with a growing efSearch / nprobe until k hits are found.
+        """
+        selector, allowed = selection
+        if allowed is not None and not allowed:
+            return []
+        embedding = _as_unit_vectors([query_vector])
+        with self._lock.read():
+            index = self._index
+            if index is None or index.ntotal == 0:
+                return []
+            k = min(k, index.ntotal if allowed is None else len(allowed))
+            if allowed is not None and index_kind(index) != "flat" and len(allowed) <= VECTOR_EXACT_FILTER_MAX:
+                hits = self._exact_hits(embedding, k, allowed)
+                if hits is not None:
+                    return hits
+            breadth = 1
+            while True:
+                params = search_parameters(index, selector, breadth)
+                if params is None:
+                    _, ids = index.search(embedding, k)
+                else:
+                    _, ids = index.search(embedding, k, params=params)
+                hits = [int(i) for i in ids[0] if i >= 0]
+                if len(hits) >= k or allowed is None or breadth >= max_breadth(index):
+                    return hits
+                breadth *= 4
+
+    def _exact_hits(self, embedding, k: int, allowed):
+        """Exact top-k among the `allowed` ids, or None if vectors.f32 cannot supply them.
+
+        Call with the read lock held. Snapshotted vectors come from vectors.f32 and
+        newer ones from the pending blocks not yet written there.
+        """
+        index = self._index
+        pending = self._pending_vectors
+        snapshot_rows = index.ntotal - sum(len(block) for block in pending)
+        if self._raw.rows(index.d) < snapshot_rows:
+            return None
+        ids = np.fromiter(sorted(allowed), dtype=np.int64, count=len(allowed))
+        ids = ids[ids < index.ntotal]
+        parts = []
+        stored = ids[ids < snapshot_rows]
+        if len(stored):
+            parts.append(np.asarray(self._raw.read(index.d, 0, snapshot_rows)[stored]))
+        offset = snapshot_rows
+        for block in pending:
+            inside = ids[(ids >= offset) & (ids < offset + len(block))]
+            if len(inside):
+                parts.append(block[inside - offset])
+            offset += len(block)
+        if not parts:
+            return []
+        # Unit vectors: the largest inner product is the smallest L2 distance
+        scores = np.concatenate(parts) @ embedding[0]
+        return [int(ids[i]) for i in np.argsort(-scores, kind="stable")[:k]]
+
+    def search(self, query: str, query_vector, k: int = 3, collection: str = None, document_ids=None,
+               mode: str = None):
+        """Top-k chunks for `query` by `mode` (RETRIEVAL_MODE by default), as Documents whose `id` is the vector id.
+
+        Hybrid mode takes HYBRID_CANDIDATES from both the vector index and the BM25
+        index (under the same collection/document filter) and merges them with
+        reciprocal rank fusion, so exact identifiers and CJK terms that embed poorly
+        are still found. Until the BM25 index has been built, every mode searches vectors only.
+        """
+        mode = mode or RETRIEVAL_MODE
+        if mode != "vector" and not self._lexical_ready.is_set():
+            mode = "vector"
+        selection = self._selector(collection, document_ids)
+        if mode == "vector":
+            return self._documents(self._vector_hits(query_vector, k, selection))
+        lexical = [chunk_id for chunk_id, _ in self._lexical.search(query, max(k, HYBRID_CANDIDATES), selection[1])]
+        if mode == "lexical":
+            return self._documents(lexical[:k])
+        vector = self._vector_hits(query_vector, max(k, HYBRID_CANDIDATES), selection)
+        return self._documents(reciprocal_rank_fusion([vector, lexical], k))
+
+    def lexical_stats(self) -> dict:
+        return dict(self._lexical.stats(), ready=self._lexical_ready.is_set())
+
+    def _documents(self, hits):
+        # Only the returned chunks are read from disk
+        rows = self._chunks.get(hits)
+        return [Document(id=str(i), page_content=rows[i][0], metadata=rows[i][1]) for i in hits if i in rows]
+
+    def add_texts(self, texts, metadatas=None):
+        if not texts:
+            return
+        vectors = _as_unit_vectors(self.embeddings.embed_documents(texts))
+        with self._snapshot_lock, self._lock.write():
+            if self._index is None:
+                self._index = faiss.IndexFlatL2(vectors.shape[1])
+            first_id = self._index.ntotal
+            ids = list(range(first_id, first_id + len(texts)))
+            # Chunk rows first, then the log: a vector is never durable without its text
+            self._chunks.add(ids, texts, metadatas)
+            for vector_id, vector in zip(ids, vectors):
+                self._wal.write(json.dumps({"id": vector_id, "vector": vector.tolist()}) + "\n")
+            self._wal.flush()
+            if WAL_FSYNC:
+                os.fsync(self._wal.fileno())
+            self._wal_records += len(texts)
+            self._index.add(vectors)
+            self._pending_vectors.append(vectors)
+            wal_records = self._wal_records
+        self._lexical.add(ids, texts)
+        with self._stats_lock:
+            for collection in {(metadata or {}).get("collection") or DEFAULT_COLLECTION for metadata in metadatas or [{}]}:
+                self._selectors.pop(collection, None)
+                self._collection_versions[collection] = self._collection_versions.get(collection, 0) + 1
+        if wal_records >= COMPACT_RECORDS:
+            self._schedule_compaction(delay=0.0)
+        else:
+            self._schedule_compaction()
+
+    def find_document(self, file_hash: str, collection: str = DEFAULT_COLLECTION):
+        """Return the stored record for an upload with these exact bytes in `collection`, if any."""
+        document = self._chunks.get_document(file_hash, collection)
+        with self._stats_lock:
+            if document is None:
+                self._new_uploads += 1
+            else:
+                self._duplicate_uploads += 1
+        return document
+
+    def register_document(self, file_hash: str, filename: str, chunk_count: int, info: dict = None,
+                          collection: str = DEFAULT_COLLECTION):
+        self._chunks.add_document(file_hash, filename, chunk_count, info, collection)
+
+    def collections(self):
+        return self._chunks.collections()
+
+    def list_documents(self, collection: str):
+        return self._chunks.list_documents(collection)
+
+    def document_stats(self) -> dict:
+        with self._stats_lock:
+            total = self._duplicate_uploads + self._new_uploads
+            return {
+                "duplicate_uploads": self._duplicate_uploads,
+                "new_uploads": self._new_uploads,
+                "hit_rate": self._duplicate_uploads / total if total else 0.0,
+            }
+
+    def _schedule_compaction(self, delay: float = None):
+        with self._compact_lock:
+            if self._timer is not None:
+                if delay is None:
+                    # Already scheduled; a checkpoint interval is not pushed back by new writes
+                    return
+                self._timer.cancel()
+            self._timer = threading.Timer(COMPACT_INTERVAL if delay is None else delay, self._compact_and_migrate)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def compact(self):
+        """Fold the write-ahead log into a new snapshot generation."""
+        with self._compact_lock:
+            self._timer = None
+        # Only writers are excluded: nothing else changes the index while the snapshot is
+        # written, and searches never wait for it
+        with self._snapshot_lock:
+            if self._index is None or not (self._wal_records or self._needs_snapshot):
+                return
+            start = time.perf_counter()
+            old_generation = self._generation
+            generation = old_generation + 1
+            snapshot = _snapshot_name(generation)
+            tmp_path = os.path.join(self.index_path, snapshot + ".tmp")
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            os.makedirs(tmp_path)
+            # Raw vectors first: rows past the published snapshot are cut off again on load
+            if self._pending_vectors:
+                self._raw.append(np.concatenate(self._pending_vectors))
+            faiss.write_index(self._index, os.path.join(tmp_path, INDEX_FILE))
+            with open(os.path.join(tmp_path, INDEX_FILE), "rb") as f:
+                os.fsync(f.fileno())
+            os.replace(tmp_path, os.path.join(self.index_path, snapshot))
+
+            # Start the new generation's (empty) log before publishing it
+            new_wal = open(self._wal_path(generation), "a", encoding="utf-8")
+            current_tmp = os.path.join(self.index_path, CURRENT_FILE + ".tmp")
+            with open(current_tmp, "w", encoding="utf-8") as f:
+                f.write(snapshot)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(current_tmp, os.path.join(self.index_path, CURRENT_FILE))
+            _fsync_dir(self.index_path)
+
+            self._wal.close()
+            self._wal = new_wal
+            compacted = self._wal_records
+            self._wal_records = 0
+            self._pending_vectors = []
+            self._needs_snapshot = False
+            self._generation = generation
+
+            # The previous generation is no longer reachable from CURRENT
+            shutil.rmtree(os.path.join(self.index_path, _snapshot_name(old_generation)), ignore_errors=True)
+            if os.path.exists(self._wal_path(old_generation)):
+                os.remove(self._wal_path(old_generation))
+        print(f"Compacted {compacted} logged chunks into {snapshot} in {time.perf_counter() - start:.2f}s.")
+
+    def _compact_and_migrate(self):
+        self.compact()
+        self._maybe_migrate()
+
+    def _migration_due(self) -> bool:
+        with self._lock.read():
+            index = self._index
+            if index is None or VECTOR_INDEX_TYPE not in INDEX_TYPES:
+                return False
+            kind = index_kind(index)
+            if VECTOR_INDEX_TYPE == "flat":
+                return kind != "flat"
+            if kind != VECTOR_INDEX_TYPE:
+                return index.ntotal >= VECTOR_INDEX_MIGRATE_AT
+            # An auto-sized IVF index is retrained once the corpus is 4x what its cells were sized for
+            if kind in ("ivf_flat", "ivf_pq") and not VECTOR_IVF_NLIST:
+                return index.ntotal > 4 * (faiss.extract_index_ivf(index).nlist / 4) ** 2
+            return False
+
+    def _maybe_migrate(self):
+        """Rebuild the index as VECTOR_INDEX_TYPE from vectors.f32 if it is due, then swap it in."""
+        with self._compact_lock:
+            if self._migrating:
+                return
+            self._migrating = True
+        try:
+            if not self._migration_due():
+                return
+            with self._lock.read():
+                dimension = self._index.d
+                old_kind = index_kind(self._index)
+                snapshot_rows = self._index.ntotal - sum(len(v) for v in self._pending_vectors)
+            rows = self._raw.rows(dimension)
+            if rows < snapshot_rows:
+                print(f"Cannot migrate the vector index: {VECTORS_FILE} holds {rows} of {snapshot_rows} vectors.")
+                return
+            start = time.perf_counter()
+            print(f"Building {VECTOR_INDEX_TYPE} vector index from {rows} vectors (currently {old_kind})...")
+            # Training and bulk adds run without the lock; searches and ingest continue
+            index = build_index(VECTOR_INDEX_TYPE, self._raw.read(dimension, 0, rows))
+            with self._snapshot_lock, self._lock.write():
+                # Catch up with vectors added while building
+                index.add(np.ascontiguousarray(self._raw.read(dimension, rows), dtype=np.float32))
+                for vectors in self._pending_vectors:
+                    index.add(vectors)
+                if index.ntotal != self._index.ntotal:
+                    print(f"Discarding rebuilt index: {index.ntotal} vectors instead of {self._index.ntotal}.")
+                    return
+                self._index = index
+                self._needs_snapshot = True
+            print(f"Migrated vector index from {old_kind} to {VECTOR_INDEX_TYPE} in "
+                  f"{time.perf_counter() - start:.2f}s; snapshotting.")
+            self._schedule_compaction(delay=0.0)
+        except Exception as e:
+            print(f"Vector index migration failed: {str(e)}")
+        finally:
+            with self._compact_lock:
+                self._migrating = False
+
+    def index_stats(self) -> dict:
+        with self._lock.read():
+            if self._index is None:
+                return {"type": "empty", "vectors": 0, "target_type": VECTOR_INDEX_TYPE}
+            return {"type": index_kind(self._index), "vectors": self._index.ntotal,
+                    "target_type": VECTOR_INDEX_TYPE, "migrate_at": VECTOR_INDEX_MIGRATE_AT,
+                    "migrating": self._migrating}
+
+    def close(self):
+        with self._compact_lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        self.compact()
+        if self._wal is not None:
+            self._wal.close()
+            self._wal = None
+        if self._chunks is not None:
+            self._chunks.close()
+
+
+_vector_store = None
+
+
+def init_vector_store(embeddings, index_path: str = FAISS_INDEX_PATH) -> VectorStoreService:
+    global _vector_store
+    _vector_store = VectorStoreService(index_path, embeddings)
+    _vector_store.load()
+    return _vector_store
+
+
+def get_vector_store() -> VectorStoreService:
+    if _vector_store is None:
+        raise RuntimeError("Vector store has not been initialized.")
+    return _vector_store
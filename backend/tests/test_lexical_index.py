@@ -0,0 +1,54 @@
+# Tests for services.lexical_index.
+#
+# Usage (from backend/):
+#   python -m pytest tests
+from services.lexical_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+def _index(texts, **options) -> BM25Index:
+    index = BM25Index(**options)
+    index.add(range(len(texts)), texts)
+    return index
+
+
+def test_tokenize_keeps_identifiers_and_cjk_bigrams():
+    tokens = tokenize("What is the part AB-1234 的 报告")
+    assert "ab-1234" in tokens and "ab" in tokens and "1234" in tokens
+    assert "报告" in tokens
+    assert "the" not in tokens and "的" not in tokens
+
+
+def test_small_corpus_matches_identifiers_and_cjk():
+    index = _index([
+        "part AB-1234 manual",
+        "part CD-5678 manual",
+        "年度报告 总结",
+        "meeting notes",
+        "budget review",
+    ])
+    assert index.search("AB-1234", 3)[0][0] == 0
+    assert index.search("报告", 3)[0][0] == 2
+
+
+def test_query_of_only_common_terms_is_still_scored():
+    texts = [f"manual chapter {n}" for n in range(20)]
+    texts[7] = "manual manual chapter 7"
+    index = _index(texts, max_df_ratio=0.1, prune_min_chunks=10)
+    hits = index.search("manual", 3)
+    assert hits and hits[0][0] == 7
+
+
+def test_common_terms_are_skipped_when_a_rarer_term_remains():
+    texts = [f"manual chapter {n}" for n in range(20)]
+    texts[3] = "manual chapter 3 AB-1234"
+    index = _index(texts, max_df_ratio=0.1, prune_min_chunks=10)
+    assert [chunk_id for chunk_id, _ in index.search("manual AB-1234", 5)] == [3]
+
+
+def test_search_respects_allowed_ids():
+    index = _index(["part AB-1234", "part AB-1234 again", "other"])
+    assert [chunk_id for chunk_id, _ in index.search("AB-1234", 3, allowed={1})] == [1]
+
+
+def test_reciprocal_rank_fusion_prefers_ids_in_both_rankings():
+    assert reciprocal_rank_fusion([[1, 2, 3], [3, 4]], 2)[0] == 3
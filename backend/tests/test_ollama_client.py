@@ -0,0 +1,172 @@
+# Tests for services.ollama_client against a local fake Ollama server.
+#
+# Usage (from backend/):
+#   python -m pytest tests
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from services.ollama_client import OllamaClient, OllamaError
+
+
+class FakeOllama(ThreadingHTTPServer):
+    """Answers POST /api/generate from a script of (status, body, delay) replies.
+
+    A body that is a list is sent as newline-delimited JSON, like a streamed
+    generation. Once the script runs out, the last reply is repeated.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, replies):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.replies = list(replies)
+        self.requests = []
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def next_reply(self, payload: dict):
+        with self._lock:
+            self.requests.append(payload)
+            return self.replies.pop(0) if len(self.replies) > 1 else self.replies[0]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        status, body, delay = self.server.next_reply(payload)
+        time.sleep(delay)
+        data = ("".join(json.dumps(line) + "\n" for line in body) if isinstance(body, list)
+                else json.dumps(body)).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/x-ndjson" if isinstance(body, list) else "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def fake_ollama():
+    servers = []
+
+    def start(*replies):
+        server = FakeOllama(replies)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _reply(text: str, status: int = 200, delay: float = 0.0):
+    return status, {"model": "test", "response": text, "done": True}, delay
+
+
+def _client(server, **options) -> OllamaClient:
+    return OllamaClient(base_url=server.url, model="test", keep_alive="5m", **options)
+
+
+def test_generate_returns_response_and_keeps_model_loaded(fake_ollama):
+    server = fake_ollama(_reply("hello"))
+
+    async def run():
+        client = _client(server)
+        await client.start()
+        try:
+            return await client.generate("hi")
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(run()) == "hello"
+    assert server.requests == [{"model": "test", "prompt": "hi", "stream": False, "keep_alive": "5m"}]
+
+
+def test_stream_yields_tokens_in_order(fake_ollama):
+    server = fake_ollama((200, [{"response": "Hel", "done": False}, {"response": "lo", "done": False},
+                                {"response": "", "done": True}], 0.0))
+
+    async def run():
+        client = _client(server)
+        await client.start()
+        try:
+            return [token async for token in client.stream("hi")]
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(run()) == ["Hel", "lo"]
+    assert server.requests[0]["stream"] is True
+
+
+def test_generate_retries_on_503(fake_ollama):
+    server = fake_ollama((503, {"error": "busy"}, 0.0), _reply("after retry"))
+
+    async def run():
+        client = _client(server, max_retries=2)
+        await client.start()
+        try:
+            return await client.generate("hi")
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(run()) == "after retry"
+    assert len(server.requests) == 2
+
+
+def test_generate_gives_up_after_max_retries(fake_ollama):
+    server = fake_ollama((503, {"error": "busy"}, 0.0))
+
+    async def run():
+        client = _client(server, max_retries=1)
+        await client.start()
+        try:
+            with pytest.raises(OllamaError):
+                await client.generate("hi")
+        finally:
+            await client.aclose()
+
+    asyncio.run(run())
+    assert len(server.requests) == 2
+
+
+def test_generate_sync_from_a_thread(fake_ollama):
+    server = fake_ollama(_reply("from thread"))
+    client = _client(server)
+    assert client.generate_sync("hi") == "from thread"
+
+
+def test_generate_sync_timeout(fake_ollama):
+    server = fake_ollama(_reply("too late", delay=2.0))
+    client = _client(server)
+    start = time.perf_counter()
+    with pytest.raises(OllamaError):
+        client.generate_sync("hi", timeout=0.3)
+    assert time.perf_counter() - start < 1.5
+
+
+def test_generate_sync_refuses_to_block_its_event_loop(fake_ollama):
+    server = fake_ollama(_reply("unused"))
+
+    async def run():
+        client = _client(server)
+        await client.start()
+        try:
+            with pytest.raises(RuntimeError):
+                client.generate_sync("hi")
+        finally:
+            await client.aclose()
+
+    asyncio.run(run())
+    assert server.requests == []
@@ -6,6 +6,7 @@ from pdf2image import convert_from_bytes
 import io
 import os
 import base64
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -181,7 +182,7 @@ def process_uploaded_file(uploaded_file):
             files_payload = {"file": (uploaded_file.name, uploaded_file.getvalue(), "application/pdf")}
             
             with st.spinner("Processing PDF directly..."):
-                resp = requests.post(endpoint_url, files=files_payload)
+                resp = requests.post(endpoint_url, files=files_payload, params=collection_params())
                 resp.raise_for_status()
                 data = resp.json()
             
@@ -205,18 +206,19 @@ def process_uploaded_file(uploaded_file):
             files_payload = {"file": (uploaded_file.name, uploaded_file.getvalue(), uploaded_file.type)}
 
             with st.spinner("Analyzing image..."):
-                resp = requests.post(endpoint_url, files=files_payload)
+                resp = requests.post(endpoint_url, files=files_payload, params=collection_params())
                 resp.raise_for_status()
                 data = resp.json()
 
             snippet = data.get("text_snippet", "No snippet available.")
             display_message("assistant", f"✅ Document processed and content embedded!\n\n📝 Text Snippet:\n{snippet}")
             
-            # Store in session state
+            # Store in session state; preview straight from the uploaded bytes
+            uploaded_file.seek(0)
             file_entry = {
                 "name": uploaded_file.name, 
                 "text_snippet": snippet, 
-                "image": data.get("image_path"),
+                "image": uploaded_file,
                 "type": "image" 
             }
             
@@ -230,6 +232,74 @@ def process_uploaded_file(uploaded_file):
         display_message("assistant", f"❌ Error processing document: {str(e)}")
         st.error(f"Failed to process {uploaded_file.name}") 
 
+def collection_params():
+    # Uploads and chat are scoped to the collection chosen in the sidebar (blank: default)
+    collection = st.session_state.get("collection", "").strip()
+    return {"collection": collection} if collection else {}
+
+def format_timestamp(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes:02d}:{seconds:02d}"
+
+def wait_for_job(current_api_url, job_id, poll_interval=2.0):
+    status_placeholder = st.empty()
+    partial_placeholder = st.empty()
+    while True:
+        resp = requests.get(f"{current_api_url}/jobs/{job_id}")
+        resp.raise_for_status()
+        job = resp.json()
+        if job["status"] == "done":
+            status_placeholder.empty()
+            partial_placeholder.empty()
+            return job["result"]
+        if job["status"] == "failed":
+            status_placeholder.empty()
+            partial_placeholder.empty()
+            raise RuntimeError(job.get("error") or "Processing failed.")
+        status = f"Job status: {job['stage']}"
+        if job.get("window_count"):
+            status += f" ({job.get('windows_done', 0)}/{job['window_count']})"
+        status_placeholder.caption(status)
+        # Show the transcript so far while a recording is still being transcribed
+        if job.get("segments"):
+            partial_placeholder.markdown("\n\n".join(
+                f"`{format_timestamp(segment['start'])}` {segment['text']}" for segment in job["segments"][-10:]
+            ))
+        time.sleep(poll_interval)
+
+def process_uploaded_images(uploaded_images):
+    try:
+        display_message("system", f"📤 Received {len(uploaded_images)} images")
+        files_payload = [("files", (f.name, f.getvalue(), f.type)) for f in uploaded_images]
+
+        with st.spinner(f"Analyzing {len(uploaded_images)} images..."):
+            resp = requests.post(f"{API_URL}/post-images", files=files_payload, params=collection_params())
+            resp.raise_for_status()
+            data = resp.json()
+
+        display_message("assistant", f"✅ {data.get('processed', 0)} images processed and embedded "
+                                     f"({data.get('duplicates', 0)} already known, {data.get('failed', 0)} failed).")
+
+        for uploaded_file, result in zip(uploaded_images, data.get("results", [])):
+            if result.get("error"):
+                display_message("assistant", f"❌ {uploaded_file.name}: {result['error']}")
+                continue
+            # Preview straight from the uploaded bytes
+            uploaded_file.seek(0)
+            file_entry = {
+                "name": uploaded_file.name,
+                "text_snippet": result.get("text_snippet", "No snippet available."),
+                "image": uploaded_file,
+                "type": "image"
+            }
+            st.session_state.processed_files.append(file_entry)
+            st.session_state.current_file = file_entry
+        st.session_state.chat_ready = True
+
+    except Exception as e:
+        display_message("assistant", f"❌ Error processing images: {str(e)}")
+        st.error("Failed to process the uploaded images")
+
 def handle_audio_processing(uploaded_audio_file_param, current_api_url, display_message_fn):
     display_message_fn("system", f"🎤 Audio file received: {uploaded_audio_file_param.name}")
 
@@ -240,9 +310,10 @@ def handle_audio_processing(uploaded_audio_file_param, current_api_url, display_
 
     try:
         with st.spinner("Transcribing and summarizing audio... This may take a moment."):
-            resp = requests.post(f"{current_api_url}/post-audio", files=files)
+            # Run as a background job and poll, so long recordings don't hit HTTP timeouts
+            resp = requests.post(f"{current_api_url}/post-audio", files=files, params={"background": "true", **collection_params()})
             resp.raise_for_status() 
-            data = resp.json()
+            data = wait_for_job(current_api_url, resp.json()["job_id"])
 
         summary = data.get('summary', 'No summary received.')
         
@@ -314,6 +385,8 @@ if "current_transcript" not in st.session_state:
 with st.sidebar:
     st.header("⚙️ Control Panel")
     mode = st.radio("Input Method:", ["Upload File", "Webcam Capture", "Audio"]) 
+    st.text_input("Collection:", key="collection", placeholder="default",
+                  help="Uploads are stored in this collection and chat only searches it.")
     
     st.markdown("---")
     st.header("Document Preview")
@@ -392,10 +465,15 @@ with st.container():
         )
         
         if uploaded_files:
-            for uploaded_file in uploaded_files: 
-                processed_file_names = [f['name'] for f in st.session_state.processed_files]
-                if uploaded_file.name not in processed_file_names:
-                    process_uploaded_file(uploaded_file) 
+            processed_file_names = [f['name'] for f in st.session_state.processed_files]
+            new_files = [f for f in uploaded_files if f.name not in processed_file_names]
+            new_images = [f for f in new_files if f.type.startswith("image")]
+            # Several images go to the batch endpoint in a single request
+            if len(new_images) > 1:
+                process_uploaded_images(new_images)
+                new_files = [f for f in new_files if f not in new_images]
+            for uploaded_file in new_files: 
+                process_uploaded_file(uploaded_file) 
     
     elif mode == "Webcam Capture":
         # Webcam mode
@@ -443,13 +521,22 @@ with st.container():
             st.session_state.messages.append({"role": "user", "content": user_query})
 
             try:
+                display_chat_message("user", user_query)
                 with st.spinner("Thinking..."):
-                    chat_payload = {"query": user_query}
-                    resp = requests.post(f"{API_URL}/chat", json=chat_payload)
+                    chat_payload = {"query": user_query, **collection_params()}
+                    resp = requests.post(f"{API_URL}/chat/stream", json=chat_payload, stream=True)
                     resp.raise_for_status()
-                    chat_data = resp.json()
 
-                assistant_response = chat_data.get("answer", "Sorry, I couldn't get a response.")
+                # Render tokens as they arrive instead of waiting for the full answer
+                resp.encoding = "utf-8"
+                answer_placeholder = st.empty()
+                assistant_response = ""
+                for chunk in resp.iter_content(chunk_size=None, decode_unicode=True):
+                    assistant_response += chunk
+                    answer_placeholder.markdown(f'<div class="assistant-message">{assistant_response}</div>', unsafe_allow_html=True)
+
+                if not assistant_response:
+                    assistant_response = "Sorry, I couldn't get a response."
                 st.session_state.messages.append({"role": "assistant", "content": assistant_response})
 
             except requests.exceptions.RequestException as e: